@@ -0,0 +1,406 @@
+"""
+高德API配额管理
+- 支持多个API密钥轮换（secrets.toml 中的 AMAP_API_KEYS，兼容单个 AMAP_API_KEY）
+- 每个密钥独立的频率限制（最近一秒内的请求数，与高德服务端一致）与每日配额计数
+- 多进程部署时可指定主机级账本文件，频率和日配额按主机合计（见 HostLedger）
+- 选择剩余配额最多、并发最少的密钥
+- 配额耗尽或连续出错的密钥触发熔断，冷却后半开试探
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytz
+import requests
+
+AMAP_BASE_URL = "https://restapi.amap.com"
+
+# 默认配额（个人开发者天气查询）
+DEFAULT_QPS = 3
+DEFAULT_DAILY_LIMIT = 5000
+
+# 高德 infocode 分类
+DAILY_LIMIT_CODES = {"10003", "10044", "10045"}  # 日访问量超限
+QPS_LIMIT_CODES = {"10004", "10014", "10015", "10019", "10020", "10021", "10029"}  # 并发/频率超限
+INVALID_KEY_CODES = {"10001", "10002", "10005", "10006", "10007", "10008", "10009", "10010", "10011", "10012", "10013"}  # 密钥不可用
+
+TIMEZONE = pytz.timezone('Asia/Shanghai')
+
+
+def _today():
+    return datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+
+
+def mask_key(key):
+    """密钥脱敏显示"""
+    return f"{key[:4]}...{key[-4:]}" if len(key) > 8 else "****"
+
+
+class RateWindow:
+    """滑动窗口限流：任意 window 秒内最多 rate 次（与高德服务端按最近一秒计数的方式一致）
+
+    margin 为额外留出的间隔，抵消请求到达服务端时的网络抖动。
+    """
+
+    def __init__(self, rate, window=1.0, margin=0.05, clock=time.monotonic):
+        self.rate = max(int(rate), 1)
+        self.span = window + margin
+        self.clock = clock
+        self.calls = deque()
+        self.blocked_until = 0.0
+
+    def _prune(self, now):
+        while self.calls and now - self.calls[0] >= self.span:
+            self.calls.popleft()
+
+    def delay(self):
+        """还需等待多少秒才能再发一次请求"""
+        now = self.clock()
+        self._prune(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if len(self.calls) < self.rate:
+            return 0.0
+        return self.calls[0] + self.span - now
+
+    def try_take(self):
+        if self.delay() > 0:
+            return False
+        self.calls.append(self.clock())
+        return True
+
+    def drain(self):
+        """服务端已报频率超限，一个窗口内不再发请求"""
+        self.blocked_until = self.clock() + self.span
+
+
+class DailyQuota:
+    """每日配额计数，按北京时间自然日重置"""
+
+    def __init__(self, limit, today=_today):
+        self.limit = int(limit)
+        self.today = today
+        self.date = today()
+        self.used = 0
+
+    def _roll(self):
+        date = self.today()
+        if date != self.date:
+            self.date = date
+            self.used = 0
+
+    def remaining(self):
+        self._roll()
+        return max(self.limit - self.used, 0)
+
+    def consume(self):
+        self._roll()
+        self.used += 1
+
+    def exhaust(self):
+        """服务端已报日配额超限，当天不再使用"""
+        self._roll()
+        self.used = self.limit
+
+
+class LocalLimits:
+    """单个密钥的频率和日配额（进程内计数）"""
+
+    def __init__(self, qps, daily_limit):
+        self.window = RateWindow(qps)
+        self.daily = DailyQuota(daily_limit)
+
+    def remaining(self):
+        return self.daily.remaining()
+
+    def delay(self):
+        """距离可以发出下一次请求的秒数，日配额已用完时为 None"""
+        if self.daily.remaining() <= 0:
+            return None
+        return self.window.delay()
+
+    def try_take(self):
+        """同时检查并占用频率和日配额"""
+        if self.daily.remaining() <= 0 or not self.window.try_take():
+            return False
+        self.daily.consume()
+        return True
+
+    def drain(self):
+        self.window.drain()
+
+    def exhaust(self):
+        self.daily.exhaust()
+
+    def load(self, entry):
+        self.window.calls = deque(entry.get("calls", []))
+        self.window.blocked_until = entry.get("blocked_until", 0.0)
+        self.daily.date = entry.get("date", self.daily.date)
+        self.daily.used = entry.get("used", 0)
+
+    def dump(self):
+        return {"calls": list(self.window.calls), "blocked_until": self.window.blocked_until,
+                "date": self.daily.date, "used": self.daily.used}
+
+
+class HostLedger:
+    """同一主机所有进程共用的配额账本（flock 保护的 JSON 文件）
+
+    Streamlit 多进程部署时每个进程各有一个 QuotaManager，频率和日配额在账本中按主机合计，
+    实际调用量不会变成进程数 × 配置值。time.monotonic 在 Linux 上是系统级时钟，各进程可直接比较。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def entry(self, name, write=True):
+        """加锁读取某个密钥的记录；write 为 True 且记录有变化时退出时写回，只读时加共享锁"""
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "r+", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+                text = f.read()
+                try:
+                    data = json.loads(text) if text.strip() else {}
+                except ValueError:
+                    data = {}
+                entry = data.setdefault(name, {})
+                yield entry
+                if write:
+                    updated = json.dumps(data)
+                    if updated != text:
+                        f.seek(0)
+                        f.truncate()
+                        f.write(updated)
+
+
+class HostLimits:
+    """单个密钥的频率和日配额（主机内所有进程合计）"""
+
+    def __init__(self, ledger, key, qps, daily_limit):
+        self.ledger = ledger
+        # 账本中只保存密钥摘要
+        self.name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        self.qps = qps
+        self.daily_limit = daily_limit
+
+    def _apply(self, method, write=True):
+        """在账本记录上执行 LocalLimits 的方法；只读查询不写回账本"""
+        with self.ledger.entry(self.name, write) as entry:
+            limits = LocalLimits(self.qps, self.daily_limit)
+            limits.load(entry)
+            result = getattr(limits, method)()
+            if write:
+                entry.update(limits.dump())
+            return result
+
+    def remaining(self):
+        return self._apply("remaining", write=False)
+
+    def delay(self):
+        return self._apply("delay", write=False)
+
+    def try_take(self):
+        return self._apply("try_take")
+
+    def drain(self):
+        self._apply("drain")
+
+    def exhaust(self):
+        self._apply("exhaust")
+
+
+class CircuitBreaker:
+    """熔断器：closed → open（冷却）→ half_open（放行一次试探）"""
+
+    def __init__(self, failure_threshold=3, cooldown=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_for = cooldown
+
+    def allow(self):
+        """是否可放行（不改变状态）"""
+        if self.state == "open":
+            return self.clock() - self.opened_at >= self.open_for
+        return self.state == "closed"
+
+    def on_acquire(self):
+        """冷却结束后的第一次放行作为试探请求"""
+        if self.state == "open":
+            self.state = "half_open"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self, cooldown=None):
+        self.state = "open"
+        self.opened_at = self.clock()
+        self.open_for = cooldown if cooldown is not None else self.cooldown
+
+
+class KeyState:
+    """单个密钥的配额与健康状态"""
+
+    def __init__(self, key, qps, daily_limit, failure_threshold, cooldown, ledger=None):
+        self.key = key
+        self.limits = LocalLimits(qps, daily_limit) if ledger is None else HostLimits(ledger, key, qps, daily_limit)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self.in_flight = 0
+        self.last_error = ""
+
+    def status(self):
+        return {
+            "key": mask_key(self.key),
+            "state": self.breaker.state,
+            "daily_remaining": self.limits.remaining(),
+            "in_flight": self.in_flight,
+            "last_error": self.last_error,
+        }
+
+
+class QuotaManager:
+    """多密钥配额管理器（线程安全，进程内共享；指定 ledger_path 时频率和日配额按主机合计）"""
+
+    def __init__(self, keys, qps=DEFAULT_QPS, daily_limit=DEFAULT_DAILY_LIMIT,
+                 failure_threshold=3, cooldown=30.0, base_url=AMAP_BASE_URL, ledger_path=None):
+        # 去重并保持顺序
+        unique_keys = list(dict.fromkeys(k for k in keys if k))
+        ledger = HostLedger(ledger_path) if ledger_path else None
+        self.keys = [KeyState(k, qps, daily_limit, failure_threshold, cooldown, ledger) for k in unique_keys]
+        self.base_url = base_url.rstrip("/")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_secrets(cls, secrets, ledger_path=None):
+        """从 secrets.toml 内容创建（AMAP_API_KEYS 列表优先，兼容单个 AMAP_API_KEY）"""
+        keys = list(secrets.get("AMAP_API_KEYS", []))
+        if secrets.get("AMAP_API_KEY"):
+            keys.append(secrets["AMAP_API_KEY"])
+        quota = secrets.get("AMAP_QUOTA", {})
+        return cls(
+            keys,
+            qps=quota.get("qps", DEFAULT_QPS),
+            daily_limit=quota.get("daily_limit", DEFAULT_DAILY_LIMIT),
+            failure_threshold=quota.get("failure_threshold", 3),
+            cooldown=quota.get("cooldown", 30.0),
+            base_url=secrets.get("AMAP_BASE_URL", AMAP_BASE_URL),
+            ledger_path=ledger_path
+        )
+
+    def acquire(self):
+        """选取一个可用密钥（剩余日配额最多、并发最少），无可用密钥时返回 None"""
+        with self._lock:
+            candidates = []
+            for state in self.keys:
+                if state.breaker.allow():
+                    remaining = state.limits.remaining()
+                    if remaining > 0:
+                        candidates.append((remaining, -state.in_flight, state))
+            candidates.sort(key=lambda item: item[:2], reverse=True)
+            # 频率和日配额的检查与占用是一次原子操作（主机级账本下其他进程可能同时在取）
+            for _, _, state in candidates:
+                if state.limits.try_take():
+                    state.breaker.on_acquire()
+                    state.in_flight += 1
+                    return state
+            return None
+
+    def _wait_time(self):
+        """只差频率令牌的密钥中最短的等待秒数；没有这样的密钥（均已熔断、试探中或配额耗尽）时返回 None"""
+        with self._lock:
+            # half_open 的密钥在试探结束前 acquire() 取不到，不值得等待
+            delays = [state.limits.delay() for state in self.keys if state.breaker.allow()]
+        return min((delay for delay in delays if delay is not None), default=None)
+
+    def release(self, state, infocode=None, error=""):
+        """归还密钥并根据结果更新熔断状态；infocode 为 None 表示网络层错误"""
+        with self._lock:
+            state.in_flight -= 1
+            # 成功或参数类错误（2xxxx，与密钥无关）都说明密钥本身可用
+            if infocode == "10000" or (infocode or "").startswith("2"):
+                state.breaker.record_success()
+                state.last_error = ""
+                return
+
+            state.last_error = error or f"infocode {infocode}"
+            if infocode in DAILY_LIMIT_CODES:
+                state.limits.exhaust()
+                state.breaker.trip()
+            elif infocode in QPS_LIMIT_CODES:
+                # 频率超限只是暂时的，停用一个窗口即可，不计入熔断
+                state.limits.drain()
+            elif infocode in INVALID_KEY_CODES:
+                state.breaker.trip(cooldown=3600.0)
+            else:
+                state.breaker.record_failure()
+
+    def request(self, path, params, timeout=10, session=None, max_wait=1.0):
+        """带配额控制的 GET 请求；密钥被限流或失效时自动换下一个密钥重试
+
+        只差频率令牌时最多等待 max_wait 秒；所有密钥都已熔断或日配额耗尽时立即返回。
+        每个密钥最多尝试一次，频率超限（10004 等）不计入尝试次数
+        """
+        http = session or requests
+        last_error = "无可用API密钥（配额耗尽或已熔断）"
+        deadline = time.monotonic() + max_wait
+        attempts = 0
+
+        while attempts < len(self.keys):
+            state = self.acquire()
+            if state is None:
+                wait = self._wait_time()
+                if wait is None or time.monotonic() + wait > deadline:
+                    break
+                time.sleep(max(wait, 0.005))
+                continue
+            try:
+                response = http.get(f"{self.base_url}{path}", params={**params, "key": state.key}, timeout=timeout)
+                data = response.json()
+            except requests.exceptions.Timeout:
+                self.release(state, error="请求超时")
+                last_error = "请求超时"
+                attempts += 1
+                continue
+            except Exception as e:
+                self.release(state, error=str(e))
+                last_error = str(e)
+                attempts += 1
+                continue
+
+            infocode = str(data.get("infocode", "10000" if data.get("status") == "1" else ""))
+            self.release(state, infocode, data.get("info", ""))
+            if data.get("status") == "1":
+                return data
+            last_error = data.get("info", "未知错误")
+            if infocode in QPS_LIMIT_CODES:
+                continue
+            # 参数类错误换密钥也无济于事，直接返回
+            if infocode not in DAILY_LIMIT_CODES | INVALID_KEY_CODES:
+                return data
+            attempts += 1
+
+        return {"status": "0", "info": last_error}
+
+    def status(self):
+        """各密钥状态（密钥已脱敏）"""
+        with self._lock:
+            return [state.status() for state in self.keys]
@@ -0,0 +1,160 @@
+"""
+韶关旅游数据目录（Catalog）快照管理
+- 每次加载生成一个带版本号的只读快照（景点、美食、文化三张表）
+- 后台线程轮询 processed_data/*.csv 的修改时间，文件变化后在后台重建快照并原子替换
+- 读取方在请求开始时取一次快照引用，请求期间始终使用同一版本，替换过程不阻塞读取
+- 已有快照时，文件缺失、解析失败或读取期间被改写都视为加载失败，继续使用旧快照；
+  只有首次加载才以空表降级
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+ENCODING = "utf-8-sig"  # 处理含 BOM 头的 UTF-8 文件
+
+# 数据文件配置（键名与 load_data 的返回顺序一致）
+DATA_FILES = {
+    "attractions": ("景点", "attractions_with_id.csv"),
+    "foods": ("美食", "food_with_id.csv"),
+    "culture": ("文化", "culture_with_id.csv"),
+}
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """某一版本的数据快照（DataFrame 视为只读，请勿原地修改）"""
+    version: int
+    attractions: pd.DataFrame
+    foods: pd.DataFrame
+    culture: pd.DataFrame
+    signature: tuple = ()
+    loaded_at: str = ""
+    errors: dict = field(default_factory=dict)
+
+
+def file_signature(data_dir):
+    """返回数据文件的 (文件名, 修改时间, 大小) 签名，文件缺失时记为 None"""
+    signature = []
+    for _, (_, filename) in DATA_FILES.items():
+        path = os.path.join(data_dir, filename)
+        try:
+            stat = os.stat(path)
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((filename, None, None))
+    return tuple(signature)
+
+
+def build_snapshot(data_dir, version):
+    """从磁盘读取全部数据文件，构建新快照（不涉及任何共享状态）"""
+    signature = file_signature(data_dir)
+    frames = {}
+    errors = {}
+
+    for key, (label, filename) in DATA_FILES.items():
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path):
+            frames[key] = pd.read_csv(path, encoding=ENCODING)
+        else:
+            errors[f"{label}数据错误"] = f"文件不存在: {path}"
+            frames[key] = pd.DataFrame()
+
+    return CatalogSnapshot(
+        version=version,
+        signature=signature,
+        loaded_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        errors=errors,
+        **frames
+    )
+
+
+class CatalogStore:
+    """持有当前快照；后台重建、原子替换"""
+
+    def __init__(self, data_dir, poll_interval=2.0):
+        self.data_dir = data_dir
+        self.poll_interval = poll_interval
+        self.last_error = ""
+        self._snapshot = None
+        self._version = 0
+        self._reload_lock = threading.Lock()  # 只串行化写入方，读取方从不加锁
+        self._stop_event = threading.Event()
+        self._watcher = None
+
+    def current(self):
+        """获取当前快照（单次属性读取，本身即原子操作）"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        if snapshot is None:
+            # 首次加载即失败，返回空快照供页面降级展示
+            snapshot = CatalogSnapshot(
+                version=0,
+                attractions=pd.DataFrame(),
+                foods=pd.DataFrame(),
+                culture=pd.DataFrame(),
+                errors={"数据加载错误": self.last_error}
+            )
+        return snapshot
+
+    def is_stale(self):
+        """磁盘上的数据文件是否已与当前快照不一致"""
+        snapshot = self._snapshot
+        return snapshot is None or file_signature(self.data_dir) != snapshot.signature
+
+    def reload(self, force=False):
+        """重建快照并替换；已有重建在进行时直接返回 False"""
+        if not self._reload_lock.acquire(blocking=self._snapshot is None):
+            return False
+        try:
+            if not force and not self.is_stale():
+                return False
+
+            snapshot = build_snapshot(self.data_dir, self._version + 1)
+
+            # 读取期间文件又被改写（流水线写到一半），放弃本次结果，等待下次轮询
+            if file_signature(self.data_dir) != snapshot.signature:
+                self.last_error = "数据文件在加载期间发生变化，稍后重试"
+                return False
+
+            # 文件缺失（如流水线先删后写）时保留旧快照，不换入空表
+            if snapshot.errors and self._snapshot is not None:
+                self.last_error = "；".join(snapshot.errors.values())
+                return False
+
+            self._version = snapshot.version
+            self._snapshot = snapshot  # 原子替换，进行中的请求继续使用旧快照
+            self.last_error = ""
+            return True
+        except Exception as e:
+            # 加载失败时保留旧快照继续服务
+            self.last_error = str(e)
+            return False
+        finally:
+            self._reload_lock.release()
+
+    def start_watcher(self):
+        """启动后台文件监视线程（重复调用无副作用）"""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """停止后台文件监视线程"""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            if self.is_stale():
+                self.reload()
+
@@ -0,0 +1,108 @@
+"""
+历史同期气候
+- 内置按城市、按一年中第几天的气候表 processed_data/climatology.csv（降雨概率、最低 / 最高气温，
+  由 scripts/build_climatology.py 生成）
+- 高德天气预报只覆盖约 4 天，更远的日期用历史同期气候补齐，不发起额外请求
+- 按 adcode 查找，区县使用所属地级市的数据；每个城市一个 366 天的列表，查找为 O(1)
+- 目前只收录韶关、广州、深圳，其他地点 covers() 为 False，预报范围外的日期保持未知天气
+- 可写入多进程共享镜像（shared_catalog），worker 挂载后直接读取共享数组
+"""
+
+import csv
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+CLIMATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processed_data", "climatology.csv")
+
+DAYS_IN_TABLE = 366
+CLIMATE_CONDITION = "历史同期"
+
+
+def day_index(day):
+    """一年中的第几天（从 0 开始，按闰年计，2 月 29 日固定为第 59 天）"""
+    return date(2000, day.month, day.day).timetuple().tm_yday - 1
+
+
+class Climatology:
+    """城市 adcode → 366 天的 (降雨概率, 最低气温, 最高气温)"""
+
+    def __init__(self, rows):
+        self.tables = {}
+        for adcode, index, rain_prob, temp_min, temp_max in rows:
+            table = self.tables.setdefault(adcode, [None] * DAYS_IN_TABLE)
+            table[index] = (rain_prob, temp_min, temp_max)
+
+    @classmethod
+    def from_csv(cls, path=CLIMATE_PATH):
+        with open(path, encoding="utf-8-sig") as f:
+            rows = [
+                (row["adcode"], int(row["day_of_year"]) - 1, float(row["rain_prob"]),
+                 float(row["temp_min"]), float(row["temp_max"]))
+                for row in csv.DictReader(f)
+            ]
+        return cls(rows)
+
+    @classmethod
+    def from_image(cls, image):
+        """直接使用共享镜像中的 [城市, 366, 3] 数组（不复制）"""
+        values = image.array("climatology.values")
+        climatology = cls.__new__(cls)
+        climatology.tables = {adcode: values[i] for i, adcode in enumerate(image.strings("climatology.adcodes"))}
+        return climatology
+
+    def add_to_image(self, writer):
+        """写入共享镜像（写入内容变化时修改 shared_catalog.REFERENCE_LAYOUT）"""
+        adcodes = sorted(self.tables)
+        writer.add_strings("climatology.adcodes", adcodes)
+        writer.add_array("climatology.values", np.array([self.tables[code] for code in adcodes], dtype=np.float64))
+
+    def _table(self, adcode):
+        for code in (adcode, adcode[:4] + "00", adcode[:2] + "0000"):
+            table = self.tables.get(code)
+            if table is not None:
+                return table
+        return None
+
+    def covers(self, adcode):
+        """是否有该地点（或所属地级市 / 省）的气候数据"""
+        return self._table(adcode) is not None
+
+    def lookup(self, adcode, day):
+        """指定地点、日期的气候值，没有数据时返回 None"""
+        table = self._table(adcode)
+        return None if table is None else tuple(table[day_index(day)])
+
+    def fill_forecast(self, weather_data, adcode, days, start_date):
+        """用历史同期气候补齐预报未覆盖的日期，返回新的天气数据（原数据不变）"""
+        forecast = list(weather_data.get("forecast", []))
+        covered = {item.get("date") for item in forecast}
+        filled = 0
+        for i in range(days):
+            day = start_date + timedelta(days=i)
+            date_str = day.strftime("%Y-%m-%d")
+            if date_str in covered:
+                continue
+            values = self.lookup(adcode, day)
+            if values is None:
+                continue
+            rain_prob, temp_min, temp_max = values
+            forecast.append({
+                "date": date_str,
+                "condition": CLIMATE_CONDITION,
+                "temp_max": f"{temp_max:.0f}",
+                "temp_min": f"{temp_min:.0f}",
+                "rain_prob": rain_prob,
+                "source": "climatology"
+            })
+            filled += 1
+        if not filled:
+            return weather_data
+        forecast.sort(key=lambda item: item.get("date", ""))
+        return {**weather_data, "forecast": forecast, "climatology_days": filled}
+
+
+def load_climatology(path=CLIMATE_PATH):
+    """加载内置气候表"""
+    return Climatology.from_csv(path)
@@ -0,0 +1,589 @@
+"""
+离线地点解析
+- 内置行政区划表 processed_data/adcodes.csv（名称、简称、拼音、拼音首字母、adcode，由 scripts/build_adcodes.py 生成）
+- 前缀树支持中文名 / 拼音 / 首字母的前缀补全，每个节点预存排好序的前若干条结果，补全只需走一遍前缀
+- 精确匹配失败时依次尝试"省市县"连写解析和模糊匹配：
+  拼音按编辑距离（删除变体索引），中文只允许同长度错字（通配变体索引），避免"丹霞山"被删字匹配到别处
+- 在调用高德API之前就把地名解析为 adcode，无法识别的地点不发起网络请求
+- 全部索引可导出为数组写入多进程共享镜像（shared_catalog），worker 挂载后直接在共享页面上查找
+"""
+
+import bisect
+import csv
+import hashlib
+import os
+import re
+import unicodedata
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+ADCODE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processed_data", "adcodes.csv")
+
+AUTOCOMPLETE_LIMIT = 8
+# 同级行政区重名时优先本地（韶关、广东）
+BIAS_PREFIXES = ("4402", "44")
+
+IGNORED_CHARS = re.compile(r"[\s'’·\-_,，]+")
+ASCII_KEY = re.compile(r"^[a-z]+$")
+HANZI_KEY = re.compile(r"^[\u4e00-\u9fff]+$")
+
+
+@dataclass(frozen=True)
+class Region:
+    """行政区划条目"""
+    adcode: str
+    name: str
+    short_name: str
+    pinyin: str
+    initials: str
+    level: int  # 1=省级，2=地级，3=县级
+
+
+@dataclass(frozen=True)
+class Resolution:
+    """地点解析结果；exact 为 False 表示经模糊匹配纠正"""
+    region: Region
+    full_name: str
+    exact: bool
+
+
+def normalize(text):
+    """全角转半角、小写、去空白和分隔符"""
+    return IGNORED_CHARS.sub("", unicodedata.normalize("NFKC", str(text)).lower())
+
+
+class _Node:
+    __slots__ = ("children", "entries", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []  # 以该节点结尾的条目下标
+        self.top = []      # 该节点子树中排序最靠前的条目下标
+
+
+class _Trie:
+    """进程内前缀树（构建索引、导出共享镜像时使用）"""
+
+    def __init__(self):
+        self.root = _Node()
+
+    def insert(self, key, idx):
+        if not key:
+            return
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+        if idx not in node.entries:
+            node.entries.append(idx)
+
+    def finalize(self, order):
+        """自底向上计算每个节点的补全结果（迭代后序遍历，避免深递归）"""
+        stack = [(self.root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+                continue
+            node.entries.sort(key=order.__getitem__)
+            merged = set(node.entries)
+            for child in node.children.values():
+                merged.update(child.top)
+            node.top = sorted(merged, key=order.__getitem__)[:AUTOCOMPLETE_LIMIT]
+
+    @staticmethod
+    def child(node, char):
+        return node.children.get(char)
+
+    @staticmethod
+    def entries(node):
+        return node.entries
+
+    @staticmethod
+    def top(node):
+        return node.top
+
+    def find(self, key):
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def words(self):
+        """前缀树中的全部词"""
+        stack = [(self.root, "")]
+        while stack:
+            node, prefix = stack.pop()
+            if node.entries:
+                yield prefix
+            stack.extend((child, prefix + char) for char, child in node.children.items())
+
+    def to_arrays(self):
+        """按广度优先编号展开为 CSR 数组：边（按字符排序）、结尾条目、补全结果"""
+        nodes = [self.root]
+        edge_offsets, edge_chars, edge_targets = [0], [], []
+        for node in nodes:  # 遍历时追加，即广度优先
+            for char in sorted(node.children):
+                edge_chars.append(ord(char))
+                edge_targets.append(len(nodes))
+                nodes.append(node.children[char])
+            edge_offsets.append(len(edge_chars))
+
+        arrays = {
+            "edge_offsets": edge_offsets,
+            "edge_chars": edge_chars,
+            "edge_targets": edge_targets,
+        }
+        for name in ("entries", "top"):
+            offsets, values = [0], []
+            for node in nodes:
+                values.extend(getattr(node, name))
+                offsets.append(len(values))
+            arrays[f"{name}_offsets"] = offsets
+            arrays[name] = values
+        return {name: np.array(values, dtype=np.int32) for name, values in arrays.items()}
+
+
+class _FlatTrie:
+    """由 CSR 数组表示的只读前缀树（数组可直接来自共享镜像）
+
+    单次查找只访问少量元素，通过 memoryview 读取（逐个取 numpy 标量开销太大），不复制数据。
+    """
+
+    def __init__(self, arrays):
+        self._edge_offsets = memoryview(arrays["edge_offsets"])
+        self._edge_chars = memoryview(arrays["edge_chars"])
+        self._edge_targets = memoryview(arrays["edge_targets"])
+        self._entry_offsets = memoryview(arrays["entries_offsets"])
+        self._entries = memoryview(arrays["entries"])
+        self._top_offsets = memoryview(arrays["top_offsets"])
+        self._top = memoryview(arrays["top"])
+        self.root = 0
+
+    def child(self, node, char):
+        start, end = self._edge_offsets[node], self._edge_offsets[node + 1]
+        code = ord(char)
+        pos = bisect.bisect_left(self._edge_chars, code, start, end)
+        if pos < end and self._edge_chars[pos] == code:
+            return self._edge_targets[pos]
+        return None
+
+    def entries(self, node):
+        return self._entries[self._entry_offsets[node]:self._entry_offsets[node + 1]].tolist()
+
+    def top(self, node):
+        return self._top[self._top_offsets[node]:self._top_offsets[node + 1]].tolist()
+
+    def find(self, key):
+        node = self.root
+        for char in key:
+            node = self.child(node, char)
+            if node is None:
+                return None
+        return node
+
+
+def _variant_hash(variant):
+    return int.from_bytes(hashlib.blake2b(variant.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _VariantIndex:
+    """变体 → 原词集合（SymSpell 思路：查询与词表生成同样的变体，查表即可得到候选）"""
+
+    def __init__(self, words, make_variants):
+        self.index = {}
+        for word in words:
+            for variant in make_variants(word, MAX_FUZZY_DISTANCE):
+                self.index.setdefault(variant, set()).add(word)
+
+    def candidates(self, variants):
+        found = set()
+        for variant in variants:
+            found.update(self.index.get(variant, ()))
+        return found
+
+    def to_arrays(self):
+        """导出为按变体哈希排序的数组；哈希冲突只会多出候选，之后按编辑距离过滤"""
+        words = sorted({word for group in self.index.values() for word in group})
+        word_ids = {word: i for i, word in enumerate(words)}
+        groups = {}
+        for variant, group in self.index.items():
+            groups.setdefault(_variant_hash(variant), set()).update(word_ids[word] for word in group)
+        hashes = sorted(groups)
+        offsets, values = [0], []
+        for h in hashes:
+            values.extend(sorted(groups[h]))
+            offsets.append(len(values))
+        return words, {
+            "hashes": np.array(hashes, dtype=np.uint64),
+            "offsets": np.array(offsets, dtype=np.int32),
+            "word_ids": np.array(values, dtype=np.int32),
+        }
+
+
+class _SharedVariantIndex:
+    """共享镜像中的变体索引：批量计算变体哈希后二分查找"""
+
+    def __init__(self, words, arrays):
+        self._words = words
+        self._hashes = arrays["hashes"]
+        self._hash_values = memoryview(arrays["hashes"])
+        self._offsets = memoryview(arrays["offsets"])
+        self._word_ids = memoryview(arrays["word_ids"])
+
+    def candidates(self, variants):
+        hashes = [_variant_hash(v) for v in variants]
+        positions = np.searchsorted(self._hashes, np.array(hashes, dtype=np.uint64)).tolist()
+        found = set()
+        for h, pos in zip(hashes, positions):
+            if pos < len(self._hash_values) and self._hash_values[pos] == h:
+                for word_id in self._word_ids[self._offsets[pos]:self._offsets[pos + 1]]:
+                    found.add(self._words[word_id])
+        return found
+
+
+class _RegionTable(Sequence):
+    """共享镜像中的行政区划表，按下标还原为 Region
+
+    常用的地点（省、市和最近查询过的区县）只有几百个，还原结果保存在进程内的有界缓存中。
+    """
+
+    CACHE_SIZE = 512
+
+    def __init__(self, image):
+        self._columns = [image.strings(f"resolver.regions.{name}") for name in REGION_TEXT_FIELDS]
+        self._levels = memoryview(image.array("resolver.regions.level"))
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        region = self._cache.get(index)
+        if region is None:
+            if index < 0:
+                index += len(self)
+            region = Region(*(column[index] for column in self._columns), self._levels[index])
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[index] = region
+        return region
+
+
+class _AdcodeLookup:
+    """共享镜像中的 adcode → Region（按 adcode 排序后二分查找）"""
+
+    def __init__(self, regions, codes, indexes):
+        self._regions = regions
+        self._codes = memoryview(codes)
+        self._indexes = memoryview(indexes)
+
+    def get(self, adcode, default=None):
+        code = int(adcode)
+        pos = bisect.bisect_left(self._codes, code)
+        if pos < len(self._codes) and self._codes[pos] == code:
+            return self._regions[self._indexes[pos]]
+        return default
+
+
+REGION_TEXT_FIELDS = ("adcode", "name", "short_name", "pinyin", "initials")
+TRIE_NAMES = ("hanzi", "pinyin", "initials")
+
+
+class LocationResolver:
+    """地名 → adcode 解析器"""
+
+    def __init__(self, regions):
+        self.regions = list(regions)
+        self.by_adcode = {region.adcode: region for region in self.regions}
+        self._order = _orders(self.regions, _rank_key)
+        self._local_order = _orders(self.regions, _local_rank_key)
+        self._hanzi = _Trie()     # 中文全称、简称
+        self._pinyin = _Trie()    # 拼音
+        self._initials = _Trie()  # 拼音首字母（过短，不参与模糊匹配）
+
+        for idx, region in enumerate(self.regions):
+            self._hanzi.insert(normalize(region.name), idx)
+            self._hanzi.insert(normalize(region.short_name), idx)
+            self._pinyin.insert(normalize(region.pinyin), idx)
+            self._initials.insert(normalize(region.initials), idx)
+
+        for trie in (self._hanzi, self._pinyin, self._initials):
+            trie.finalize(self._order)
+
+        # 模糊匹配索引在第一次模糊查询时才构建
+        self._pinyin_variants = None
+        self._hanzi_variants = None
+
+    @classmethod
+    def from_csv(cls, path=ADCODE_PATH):
+        with open(path, encoding="utf-8-sig") as f:
+            regions = [
+                Region(row["adcode"], row["name"], row["short_name"], row["pinyin"], row["initials"], int(row["level"]))
+                for row in csv.DictReader(f)
+            ]
+        return cls(regions)
+
+    @classmethod
+    def from_image(cls, image):
+        """直接使用共享镜像中的数组（不复制，不重建索引）"""
+        resolver = cls.__new__(cls)
+        resolver.regions = _RegionTable(image)
+        resolver.by_adcode = _AdcodeLookup(
+            resolver.regions, image.array("resolver.adcode.codes"), image.array("resolver.adcode.indexes")
+        )
+        resolver._order = memoryview(image.array("resolver.order"))
+        resolver._local_order = memoryview(image.array("resolver.local_order"))
+        for name in TRIE_NAMES:
+            arrays = {
+                field: image.array(f"resolver.{name}.{field}")
+                for field in ("edge_offsets", "edge_chars", "edge_targets",
+                              "entries_offsets", "entries", "top_offsets", "top")
+            }
+            setattr(resolver, f"_{name}", _FlatTrie(arrays))
+        for name in ("pinyin", "hanzi"):
+            arrays = {field: image.array(f"resolver.{name}_variants.{field}") for field in ("hashes", "offsets", "word_ids")}
+            setattr(resolver, f"_{name}_variants",
+                    _SharedVariantIndex(image.strings(f"resolver.{name}_variants.words"), arrays))
+        return resolver
+
+    def add_to_image(self, writer):
+        """把行政区划表和全部索引（含模糊匹配索引）写入共享镜像（写入内容变化时修改 shared_catalog.REFERENCE_LAYOUT）"""
+        for name in REGION_TEXT_FIELDS:
+            writer.add_strings(f"resolver.regions.{name}", [getattr(region, name) for region in self.regions])
+        writer.add_array("resolver.regions.level", np.array([region.level for region in self.regions], dtype=np.uint8))
+        codes = np.array([int(region.adcode) for region in self.regions], dtype=np.int64)
+        by_code = np.argsort(codes, kind="stable")
+        writer.add_array("resolver.adcode.codes", codes[by_code])
+        writer.add_array("resolver.adcode.indexes", by_code.astype(np.int32))
+        writer.add_array("resolver.order", np.array(self._order, dtype=np.int32))
+        writer.add_array("resolver.local_order", np.array(self._local_order, dtype=np.int32))
+        for name in TRIE_NAMES:
+            for field, array in getattr(self, f"_{name}").to_arrays().items():
+                writer.add_array(f"resolver.{name}.{field}", array)
+        for name, variants in (("pinyin", self._pinyin_variant_index()), ("hanzi", self._hanzi_variant_index())):
+            words, arrays = variants.to_arrays()
+            writer.add_strings(f"resolver.{name}_variants.words", words)
+            for field, array in arrays.items():
+                writer.add_array(f"resolver.{name}_variants.{field}", array)
+
+    def full_name(self, region):
+        """带上级行政区的完整名称（如"广东省韶关市仁化县"）"""
+        parts = []
+        for code in (region.adcode[:2] + "0000", region.adcode[:4] + "00"):
+            parent = self.by_adcode.get(code)
+            if parent is not None and parent.adcode != region.adcode:
+                parts.append(parent.name)
+        parts.append(region.name)
+        return "".join(parts)
+
+    def complete(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """前缀补全（中文 / 拼音 / 首字母）"""
+        key = normalize(prefix)
+        if not key:
+            return []
+        found = []
+        tries = (self._pinyin, self._initials) if ASCII_KEY.match(key) else (self._hanzi,)
+        for trie in tries:
+            node = trie.find(key)
+            if node is not None:
+                found.extend(idx for idx in trie.top(node) if idx not in found)
+        found.sort(key=self._order.__getitem__)
+        return [self.regions[idx] for idx in found[:limit]]
+
+    def resolve(self, text):
+        """把地名解析为行政区；无法识别时返回 None"""
+        key = normalize(text)
+        if not key:
+            return None
+
+        is_pinyin = ASCII_KEY.match(key) is not None
+        if not is_pinyin and not HANZI_KEY.match(key):
+            return None
+        trie = self._pinyin if is_pinyin else self._hanzi
+        node = trie.find(key)
+        if node is not None:
+            entries = trie.entries(node)
+            if entries:
+                return self._resolution(entries[0], True)
+
+        if not is_pinyin:
+            idx = self._resolve_compound(key)
+            if idx is not None:
+                return self._resolution(idx, True)
+
+        matches = self.fuzzy(key)
+        if matches:
+            return self._resolution(matches[0], False)
+        return None
+
+    def _resolution(self, idx, exact):
+        region = self.regions[idx]
+        return Resolution(region, self.full_name(region), exact)
+
+    def _resolve_compound(self, key):
+        """解析"广东韶关仁化"这类逐级连写的地名，返回与上级一致的最末级条目"""
+        trie = self._hanzi
+        segments = []
+        pos = 0
+        while pos < len(key):
+            node = trie.root
+            matched_end, matched = None, None
+            for end in range(pos, len(key)):
+                node = trie.child(node, key[end])
+                if node is None:
+                    break
+                entries = trie.entries(node)
+                if entries:
+                    matched_end, matched = end + 1, entries
+            if matched is None:
+                return None
+            segments.append(matched)
+            pos = matched_end
+
+        if len(segments) < 2:
+            return None
+
+        def consistent(idx, parents):
+            code = self.regions[idx].adcode
+            return any(
+                code.startswith(self.regions[p].adcode[:2 * self.regions[p].level]) for p in parents
+            )
+
+        candidates = segments[-1]
+        for parents in segments[:-1]:
+            candidates = [idx for idx in candidates if consistent(idx, parents)]
+        return candidates[0] if candidates else None
+
+    def fuzzy(self, text, max_distance=None):
+        """模糊匹配，返回按 (距离, 地域, 级别) 排列的条目下标
+
+        拼音输入按编辑距离匹配；中文输入只允许同长度的错字（替换），不做增删。
+        """
+        key = normalize(text)
+        is_pinyin = ASCII_KEY.match(key) is not None
+        if not is_pinyin and not HANZI_KEY.match(key):
+            return []
+        if max_distance is None:
+            if is_pinyin:
+                max_distance = 0 if len(key) <= 3 else 1 if len(key) <= 6 else 2
+            else:
+                max_distance = 0 if len(key) <= 1 else 1 if len(key) <= 5 else 2
+        max_distance = min(max_distance, MAX_FUZZY_DISTANCE)
+        if max_distance == 0:
+            return []
+
+        if is_pinyin:
+            candidates = self._pinyin_variant_index().candidates(_deletions(key, max_distance))
+            distances = {word: _levenshtein(key, word, max_distance) for word in candidates}
+            trie = self._pinyin
+        else:
+            candidates = self._hanzi_variant_index().candidates(_wildcards(key, max_distance))
+            distances = {word: _hamming(key, word) for word in candidates}
+            trie = self._hanzi
+
+        results = {}
+        for word, distance in distances.items():
+            if 0 < distance <= max_distance:
+                for idx in trie.entries(trie.find(word)):
+                    results[idx] = min(results.get(idx, distance), distance)
+        # 纠错结果本地优先：同距离时先比较地域，再比较级别
+        return sorted(results, key=lambda idx: (results[idx], self._local_order[idx]))
+
+    def _pinyin_variant_index(self):
+        if self._pinyin_variants is None:
+            self._pinyin_variants = _VariantIndex(self._pinyin.words(), _deletions)
+        return self._pinyin_variants
+
+    def _hanzi_variant_index(self):
+        if self._hanzi_variants is None:
+            self._hanzi_variants = _VariantIndex(self._hanzi.words(), _wildcards)
+        return self._hanzi_variants
+
+
+def _rank_key(region):
+    """补全排序：级别、地域、adcode"""
+    return (region.level, _bias(region), region.adcode)
+
+
+def _local_rank_key(region):
+    """纠错排序：地域、级别、adcode"""
+    return (_bias(region), region.level, region.adcode)
+
+
+def _bias(region):
+    return next((i for i, prefix in enumerate(BIAS_PREFIXES) if region.adcode.startswith(prefix)), len(BIAS_PREFIXES))
+
+
+def _orders(regions, key):
+    """每个条目在给定排序下的名次（名次越小越靠前）"""
+    order = [0] * len(regions)
+    for position, idx in enumerate(sorted(range(len(regions)), key=lambda i: key(regions[i]))):
+        order[idx] = position
+    return order
+
+
+MAX_FUZZY_DISTANCE = 2
+
+
+def _deletions(word, max_distance):
+    """删除至多 max_distance 个字符得到的全部变体（含原词）"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def _wildcards(word, max_distance):
+    """把至多 max_distance 个字替换为通配符得到的全部变体（长度不变）"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(min(max_distance, len(word) - 1)):
+        frontier = {w[:i] + "*" + w[i + 1:] for w in frontier for i in range(len(w)) if w[i] != "*"}
+        variants |= frontier
+    return variants
+
+
+def _levenshtein(a, b, limit):
+    """带上限的编辑距离：只计算对角线附近 limit 宽的带，超过上限时返回 limit + 1"""
+    too_far = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return too_far
+    previous = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        start = max(1, i - limit)
+        if start == 1 and i <= limit:
+            current[0] = i
+        row_min = current[0]
+        char_a = a[i - 1]
+        for j in range(start, min(len(b), i + limit) + 1):
+            value = previous[j - 1] + (char_a != b[j - 1])
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return too_far
+        previous = current
+    return min(previous[-1], too_far)
+
+
+def _hamming(a, b):
+    return sum(x != y for x, y in zip(a, b)) if len(a) == len(b) else len(a) + len(b)
+
+
+def load_resolver(path=ADCODE_PATH):
+    """从内置行政区划表创建解析器"""
+    return LocationResolver.from_csv(path)
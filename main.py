@@ -1,13 +1,21 @@
 import streamlit as st
-import pandas as pd
-import requests
 import os
 import json
-from datetime import datetime, timedelta
-import pytz
+import gc
+from datetime import datetime
 import time
 import toml
 
+from amap_quota import QuotaManager, mask_key
+from catalog import CatalogStore
+from climatology import load_climatology
+from location_resolver import load_resolver
+from permalink import PlanStore
+from shared_catalog import SharedCatalogHost, SharedCatalogStore, attach_reference
+from traffic_log import TrafficLog, resolve_path
+import planner
+import planning
+
 # 设置页面配置
 st.set_page_config(
     page_title="韶关个性化旅游攻略生成器",
@@ -29,6 +37,15 @@ if 'data_loaded' not in st.session_state:
     st.session_state.data_loaded = False
 if 'secrets_loaded' not in st.session_state:
     st.session_state.secrets_loaded = False
+if 'itineraries' not in st.session_state:
+    st.session_state.itineraries = []
+if 'plan_index' not in st.session_state:
+    st.session_state.plan_index = 0
+
+# 一次生成的备选方案数量
+PLAN_ALTERNATIVES = 5
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "processed_data")
 
 # 加载Secrets函数
 def load_secrets():
@@ -41,10 +58,13 @@ def load_secrets():
             st.session_state.secrets = secrets
             st.session_state.secrets_loaded = True
             
-            # 验证密钥格式
-            amap_key = secrets.get("AMAP_API_KEY", "")
-            if not amap_key or len(amap_key) != 32:
-                st.session_state.debug_info["Secrets状态"] = f"警告：API密钥格式异常 ({amap_key[:4]}...)"
+            # 验证密钥格式（AMAP_API_KEYS 密钥池 + AMAP_API_KEY）
+            amap_keys = QuotaManager.from_secrets(secrets).keys
+            bad_keys = [state.key for state in amap_keys if len(state.key) != 32]
+            if not amap_keys:
+                st.session_state.debug_info["Secrets状态"] = "警告：未配置API密钥"
+            elif bad_keys:
+                st.session_state.debug_info["Secrets状态"] = f"警告：API密钥格式异常 ({', '.join(mask_key(k) for k in bad_keys)})"
             else:
                 st.session_state.debug_info["Secrets状态"] = f"加载成功 ({secrets_path})"
             
@@ -65,206 +85,237 @@ def load_secrets():
         st.session_state.debug_info["Secrets错误"] = str(e)
         return False
 
+# 本机共享数据镜像（同一主机上的 worker 进程共用一份只读的地点表、解析索引和气候表）
+@st.cache_resource
+def get_shared_catalog():
+    """打开镜像目录，不可用时返回 None（各进程自行加载数据）"""
+    try:
+        return SharedCatalogHost()
+    except OSError:
+        return None
+
+# 数据目录（进程内共享，后台监视 processed_data 变化并热加载）
+@st.cache_resource
+def get_catalog_store():
+    """创建数据目录并启动文件监视线程：共享镜像可用时后台发布 / 挂载新版本的镜像
+    （本进程不创建 DataFrame），否则在进程内加载快照"""
+    store = None
+    host = get_shared_catalog()
+    if host is not None:
+        store = SharedCatalogStore(
+            host, DATA_DIR, lambda snapshot: planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture)
+        )
+        if store.current() is None:
+            store = None  # 镜像目录已满或不可写时退回进程内加载
+    if store is None:
+        store = CatalogStore(DATA_DIR)
+        store.reload()
+    store.start_watcher()
+    return store
+
+@st.cache_resource
+def get_reference_data():
+    """地点解析器和气候表：优先挂载共享镜像"""
+    host = get_shared_catalog()
+    if host is not None:
+        try:
+            return attach_reference(host)
+        except OSError:
+            pass  # 镜像目录已满或不可写时退回进程内加载
+    return load_resolver(), load_climatology()
+
+# 进程级共享资源预热（每个进程只执行一次）
+@st.cache_resource
+def warm_up_shared_resources():
+    """加载数据目录、地点解析器和气候表，并把这些长期存活的对象冻结到GC永久代，
+    Streamlit每次重跑后的 gc.collect() 不必再遍历它们"""
+    get_catalog_store()
+    get_location_resolver()
+    get_climatology()
+    gc.collect()
+    gc.freeze()
+    return True
+
 # 加载数据函数
-@st.cache_data
+def record_catalog_info(version, counts, loaded_at, errors):
+    """显示缺失文件等错误并更新调试信息"""
+    for key, message in errors.items():
+        st.error(message)
+        st.session_state.debug_info[key] = message
+    
+    st.session_state.debug_info.update({
+        "当前目录": os.path.dirname(DATA_DIR),
+        "数据目录": DATA_DIR,
+        "数据版本": version,
+        "景点记录数": counts["attractions"],
+        "美食记录数": counts["foods"],
+        "文化记录数": counts["culture"],
+        "数据加载时间": loaded_at
+    })
+
 def load_data():
-    """加载景点、美食和文化数据"""
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(current_dir, "processed_data")
+    """加载当前版本数据目录的规划用地点列表（取一次版本引用，请求期间保持不变）"""
+    store = get_catalog_store()
     
     try:
-        # 景点数据
-        attractions_path = os.path.join(data_dir, "attractions_with_id.csv")
-        if os.path.exists(attractions_path):
-            attractions = pd.read_csv(attractions_path, encoding="utf-8-sig")
+        snapshot = store.current()
+        if isinstance(store, SharedCatalogStore):
+            # 共享镜像中只有地点表和记录数，本进程不读取 CSV、不创建 DataFrame
+            counts, pois = snapshot.counts, snapshot.pois
         else:
-            st.error(f"景点数据文件不存在: {attractions_path}")
-            st.session_state.debug_info["景点数据错误"] = f"文件不存在: {attractions_path}"
-            attractions = pd.DataFrame()
-        
-        # 美食数据
-        food_path = os.path.join(data_dir, "food_with_id.csv")
-        if os.path.exists(food_path):
-            foods = pd.read_csv(food_path, encoding="utf-8-sig")
-        else:
-            st.error(f"美食数据文件不存在: {food_path}")
-            st.session_state.debug_info["美食数据错误"] = f"文件不存在: {food_path}"
-            foods = pd.DataFrame()
-        
-        # 文化数据
-        culture_path = os.path.join(data_dir, "culture_with_id.csv")
-        if os.path.exists(culture_path):
-            culture = pd.read_csv(culture_path, encoding="utf-8-sig")
-        else:
-            st.error(f"文化数据文件不存在: {culture_path}")
-            st.session_state.debug_info["文化数据错误"] = f"文件不存在: {culture_path}"
-            culture = pd.DataFrame()
-        
-        # 更新调试信息
-        st.session_state.debug_info.update({
-            "当前目录": current_dir,
-            "数据目录": data_dir,
-            "景点记录数": len(attractions),
-            "美食记录数": len(foods),
-            "文化记录数": len(culture),
-            "数据加载时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+            counts = {name: len(getattr(snapshot, name)) for name in ("attractions", "foods", "culture")}
+            pois = get_poi_index(snapshot.signature, snapshot.attractions, snapshot.foods, snapshot.culture)
+        record_catalog_info(snapshot.version, counts, snapshot.loaded_at, snapshot.errors)
+        if store.last_error:
+            st.session_state.debug_info["数据热加载状态"] = store.last_error
         
         st.session_state.data_loaded = True
-        return attractions, foods, culture
+        st.session_state.catalog_signature = snapshot.signature
+        return pois
     except Exception as e:
         st.error(f"数据加载失败: {str(e)}")
         st.session_state.debug_info["数据加载错误"] = str(e)
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        return []
+
+# 高德API配额管理器（进程内共享，所有会话共用同一组熔断器；
+# 频率和日配额记在本机共享目录的账本中，多个 worker 进程合计不超过配置值）
+@st.cache_resource
+def get_quota_manager(secrets_json):
+    """根据secrets内容创建配额管理器"""
+    host = get_shared_catalog()
+    ledger_path = os.path.join(host.directory, "amap_quota.json") if host is not None else None
+    return QuotaManager.from_secrets(json.loads(secrets_json), ledger_path=ledger_path)
+
+def current_quota_manager():
+    """当前会话secrets对应的配额管理器，未加载secrets时返回 None"""
+    if not hasattr(st.session_state, 'secrets'):
+        return None
+    return get_quota_manager(json.dumps(st.session_state.secrets, sort_keys=True, default=str))
+
+# 表单提交记录（secrets.toml 中配置 TRAFFIC_LOG 时启用，供 scripts/replay_traffic.py 回放）
+@st.cache_resource
+def get_traffic_log(path):
+    """同一路径的记录器在所有会话间共享"""
+    return TrafficLog(path)
+
+def record_submission(location, travel_days, travel_theme):
+    """记录一次表单提交，写入失败不影响行程生成"""
+    path = getattr(st.session_state, "secrets", {}).get("TRAFFIC_LOG")
+    if not path:
+        return
+    try:
+        get_traffic_log(resolve_path(path, os.path.dirname(os.path.abspath(__file__)))).record(
+            location, travel_days, travel_theme
+        )
+    except OSError as e:
+        st.session_state.debug_info["提交记录错误"] = str(e)
+
+# 规划用地点索引（共享镜像不可用时每个数据版本在进程内构建一次）
+@st.cache_resource(max_entries=2)
+def get_poi_index(signature, _attractions, _foods, _culture):
+    """把数据目录转换为规划用的地点列表"""
+    return planner.build_pois(_attractions, _foods, _culture)
+
+def load_pois():
+    """加载当前数据版本对应的地点列表"""
+    pois = load_data()
+    host = get_shared_catalog()
+    if host is not None:
+        st.session_state.debug_info["共享数据镜像"] = ", ".join(
+            f"{key} ({info['bytes'] // 1024}KB)" for key, info in sorted(host.status().items())
+        )
+    return pois
+
+# 离线地点解析器（进程内共享，只加载一次）
+def get_location_resolver():
+    """内置行政区划表的解析器"""
+    return get_reference_data()[0]
+
+# 历史同期气候表（进程内共享，只加载一次）
+def get_climatology():
+    """内置气候表"""
+    return get_reference_data()[1]
+
+def fill_weather_gaps(weather_data, location, days):
+    """预报未覆盖的日期用历史同期气候补齐（不发起额外请求）"""
+    resolved = get_location_resolver().resolve(location)
+    if resolved is None:
+        return weather_data
+    filled, note = planning.fill_weather_gaps(get_climatology(), weather_data, resolved, days)
+    st.session_state.debug_info["气候补齐"] = note
+    return filled
+
+def record_weather_status(location, resolved, weather_data, manager):
+    """把地点解析和天气请求结果写入调试信息"""
+    if resolved is None:
+        st.session_state.debug_info["天气API状态"] = weather_data["message"]
+        return
+    st.session_state.debug_info["地点解析"] = f"{location} → {resolved.full_name}（{resolved.region.adcode}）"
+    if manager is not None and manager.keys:
+        st.session_state.debug_info["API密钥池"] = manager.status()
+    if weather_data.get("status") == "success":
+        st.session_state.debug_info["天气API状态"] = "可用"
+    elif manager is None or not manager.keys:
+        st.session_state.debug_info["天气API状态"] = weather_data["message"]
+    else:
+        st.session_state.debug_info["天气API状态"] = f"错误: {weather_data.get('message', '未知错误')}"
+
+def location_suggestions(location):
+    """无法识别的地点的补全建议（已按全称显示），没有时为空列表"""
+    resolver = get_location_resolver()
+    return [resolver.full_name(region) for region in resolver.complete(location)]
 
 # 获取高德天气函数 - 修复版本
 def get_amap_weather(location="韶关"):
     """使用高德API获取天气信息"""
-    try:
-        # 检查secrets是否加载
-        if not hasattr(st.session_state, 'secrets') or "AMAP_API_KEY" not in st.session_state.secrets:
-            st.session_state.debug_info["天气API状态"] = "API密钥未配置"
-            return {"status": "error", "message": "API密钥未配置"}
-        
-        api_key = st.session_state.secrets["AMAP_API_KEY"]
-        
-        # 构建请求URL
-        base_url = "https://restapi.amap.com/v3/weather/weatherInfo"
-        params = {
-            "key": api_key,
-            "city": location,
-            "extensions": "all",  # 获取预报天气
-            "output": "JSON"
-        }
-        
-        # 发送请求
-        response = requests.get(base_url, params=params, timeout=10)
-        weather_data = response.json()
-        
-        # 检查API响应状态
-        if weather_data.get("status") != "1":
-            error_msg = weather_data.get('info', '未知错误')
-            st.session_state.debug_info["天气API状态"] = f"错误: {error_msg}"
-            return {"status": "error", "message": error_msg}
-        
-        # 解析预报数据
-        forecasts = weather_data.get("forecasts", [])
-        if not forecasts:
-            st.session_state.debug_info["天气API状态"] = "无预报数据"
-            return {"status": "error", "message": "无预报数据"}
-        
-        # 处理预报数据
-        processed_forecast = []
-        for forecast in forecasts[0].get("casts", []):
-            # 获取日期和天气信息
-            date_str = forecast.get("date")
-            weather_day = forecast.get("dayweather", "未知")
-            temp_day = forecast.get("daytemp", "未知")
-            temp_night = forecast.get("nighttemp", "未知")
-            
-            # 添加到预报列表
-            processed_forecast.append({
-                "date": date_str,
-                "condition": weather_day,
-                "temp_max": temp_day,
-                "temp_min": temp_night
-            })
-        
-        # 返回结构化的天气数据
-        result = {
-            "status": "success",
-            "location": location,
-            "report_time": weather_data.get("forecasts", [{}])[0].get("reporttime", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            "forecast": processed_forecast
-        }
-        
-        st.session_state.debug_info["天气API状态"] = "可用"
-        return result
-    except requests.exceptions.Timeout:
-        st.session_state.debug_info["天气API状态"] = "请求超时"
-        return {"status": "error", "message": "请求超时"}
-    except Exception as e:
-        st.session_state.debug_info["天气API状态"] = f"错误: {str(e)}"
-        return {"status": "error", "message": str(e)}
+    # 先在本地把地名解析为adcode，无法识别的地点不发起请求
+    resolved = get_location_resolver().resolve(location)
+    manager = current_quota_manager()
+    if resolved is None:
+        weather_data = {"status": "error", "message": f"无法识别的地点: {location}"}
+    else:
+        weather_data = planning.fetch_weather(manager, resolved, location)
+    record_weather_status(location, resolved, weather_data, manager)
+    return weather_data
 
 # 生成行程函数 - 修复日期格式问题
-def generate_itinerary(days, theme, weather_data):
-    """生成个性化行程"""
+def generate_itinerary(location, days, theme, pois, k=PLAN_ALTERNATIVES):
+    """执行规划流程，一次返回 k 个备选方案（第一个为最优方案，已保存永久链接）"""
+    manager = current_quota_manager()
     try:
-        # 模拟生成行程
-        itinerary = {
-            "status": "success",
-            "days": []
-        }
-        
-        # 获取当前日期
-        current_date = datetime.now(pytz.timezone('Asia/Shanghai'))
-        
-        for i in range(days):
-            # 获取当天的日期和天气
-            day_date = current_date + timedelta(days=i)
-            date_str = day_date.strftime("%Y-%m-%d")
-            
-            # 查找对应的天气预报
-            day_weather = None
-            if "forecast" in weather_data:
-                for forecast in weather_data["forecast"]:
-                    if forecast.get("date") == date_str:
-                        day_weather = forecast
-                        break
-            
-            # 如果没有找到当天的预报，使用默认值
-            if not day_weather:
-                day_weather = {
-                    "condition": "未知",
-                    "temp_max": "未知",
-                    "temp_min": "未知"
-                }
-            
-            # 根据天气调整行程
-            if "雨" in day_weather["condition"]:
-                activities = [
-                    f"上午: 南华寺（室内活动，参拜六祖真身）",
-                    f"午餐: 南华寺素食馆（人均64元·推荐普度斋）",
-                    f"下午: 韶关博物馆（了解本地历史）",
-                    f"傍晚: 非遗工坊体验（瑶族传统工艺）"
-                ]
-            elif "晴" in day_weather["condition"]:
-                activities = [
-                    f"上午: 丹霞山（世界自然遗产）",
-                    f"午餐: 农家乐（人均50元·推荐丹霞豆腐）",
-                    f"下午: 古佛岩（喀斯特地貌）",
-                    f"傍晚: 温泉体验（推荐经律论温泉）"
-                ]
-            else:
-                activities = [
-                    f"上午: 珠玑古巷（千年古道）",
-                    f"午餐: 百年老店（人均60元·推荐梅菜扣肉）",
-                    f"下午: 梅关古道（历史遗迹）",
-                    f"傍晚: 当地夜市体验（品尝特色小吃）"
-                ]
-            
-            # 添加日期和天气信息
-            weather_display = f"{day_weather['condition']}·{day_weather['temp_min']}~{day_weather['temp_max']}℃"
-            
-            # 使用正确的中文日期表示
-            day_names = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-            day_name = day_names[day_date.weekday()]
-            
-            itinerary["days"].append({
-                "date": date_str,
-                "day": i+1,
-                "day_name": day_name,
-                "weather": weather_display,
-                "activities": activities
-            })
-        
-        st.session_state.itinerary_generated = True
-        return itinerary
+        result = planning.plan_trip(
+            location, days, theme, pois, get_location_resolver(), get_climatology(), manager,
+            store=get_plan_store(), k=k
+        )
     except Exception as e:
         st.error(f"行程生成失败: {str(e)}")
         st.session_state.debug_info["行程生成错误"] = str(e)
         return {"status": "error", "message": str(e)}
+    
+    record_weather_status(location, result.resolved, result.weather, manager)
+    if result.climatology:
+        st.session_state.debug_info["气候补齐"] = result.climatology
+    if result.store_error:
+        st.session_state.debug_info["行程存储错误"] = result.store_error
+    elif result.key:
+        # 渲染时直接使用已保存的链接，不再重复写入
+        st.session_state.itinerary_permalink = (result.alternatives[0], result.key)
+    st.session_state.itinerary_generated = True
+    return {"status": "success", "alternatives": result.alternatives}
+
+# 增量更新行程函数
+def replan_itinerary(itinerary, weather_data, pois=None):
+    """根据最新天气只重算天气分支变化的日期，返回重新规划的日期列表"""
+    try:
+        new_itinerary, replanned = planner.replan_itinerary(itinerary, weather_data, pois)
+        st.session_state.itinerary = new_itinerary
+        st.session_state.itineraries[st.session_state.plan_index] = new_itinerary
+        st.session_state.debug_info["增量规划"] = f"重算 {len(replanned)}/{len(itinerary['days'])} 天"
+        return replanned
+    except Exception as e:
+        st.error(f"行程更新失败: {str(e)}")
+        st.session_state.debug_info["行程更新错误"] = str(e)
+        return None
 
 # 加载提示词函数 - 修复版本
 def load_prompts():
@@ -293,8 +344,291 @@ def load_prompts():
         st.session_state.debug_info["提示词错误"] = str(e)
         return False
 
-# 主应用界面
+# 侧边栏工具（片段：点击按钮只重跑本片段）
+@st.fragment
+def sidebar_tools(location):
+    """API状态检查与密钥验证"""
+    # 状态检查
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("检查DeepSeek状态"):
+            st.success("DeepSeek API 连接正常！")
+    
+    with col2:
+        if st.button("检查天气API状态"):
+            with st.spinner("检查天气API..."):
+                weather_data = get_amap_weather(location)
+                if weather_data.get("status") == "success":
+                    st.success(f"天气API可用（更新时间: {weather_data.get('report_time', '未知')}）")
+                else:
+                    st.error(f"天气API不可用: {weather_data.get('message', '未知错误')}")
+    
+    # 添加验证API密钥的按钮
+    if st.button("验证API密钥"):
+        # 检查是否已加载secrets且包含高德密钥
+        manager = current_quota_manager()
+        if manager is None or not manager.keys:
+            st.error("未找到API密钥配置")
+        else:
+            for state in manager.keys:
+                status = state.status()
+                st.info(f"密钥 {status['key']}: 状态 {status['state']}，今日剩余 {status['daily_remaining']} 次")
+                
+                # 简单验证密钥格式
+                if len(state.key) != 32:
+                    st.error("密钥长度应为32字符")
+                else:
+                    st.success("密钥格式正确")
+
+# 行程表单（片段：调整滑块和主题不触发整页重跑）
+@st.fragment
+def travel_form(location):
+    """行程天数、主题选择与生成"""
+    with st.form("travel_form"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            travel_days = st.slider("行程天数", 1, 7, 3)
+        
+        with col2:
+            travel_theme = st.selectbox(
+                "旅行主题",
+                ["历史人文", "自然风光", "美食探索", "文化体验", "家庭亲子"],
+                index=0
+            )
+        
+        if st.form_submit_button("一键生成攻略", use_container_width=True):
+            record_submission(location, travel_days, travel_theme)
+            # 无法识别的地点不生成行程，提示修改侧边栏中的旅行地点
+            if get_location_resolver().resolve(location) is None:
+                suggestions = location_suggestions(location)
+                hint = f"，您是否要找：{'、'.join(suggestions)}" if suggestions else "，请在侧边栏修改旅行地点"
+                st.warning(f"无法识别的地点: {location}{hint}")
+                st.session_state.debug_info["天气API状态"] = f"无法识别的地点: {location}"
+                return
+            with st.spinner("AI 正在规划行程..."):
+                # 加载数据
+                pois = load_pois()
+                
+                # 生成行程（地点解析 → 天气 → 历史同期气候补齐 → 备选方案 → 永久链接）
+                itinerary = generate_itinerary(location, travel_days, travel_theme, pois)
+                
+                # 保存结果（全部备选方案，切换时无需重新计算）
+                if itinerary.get("status") == "success":
+                    st.session_state.itineraries = itinerary["alternatives"]
+                    st.session_state.plan_index = 0
+                    st.session_state.itinerary = itinerary["alternatives"][0]
+                    st.session_state.location = location
+                    st.toast("攻略生成成功！", icon="✅")
+                    # 行程区和调试信息在片段之外，需要整页刷新一次
+                    st.rerun()
+                else:
+                    st.error("攻略生成失败，请重试或检查API设置")
+
+def itinerary_blocks(itinerary):
+    """行程的渲染内容（同一行程只拼接一次，每天的活动合并为一段 markdown）"""
+    cached = st.session_state.get("itinerary_render")
+    if cached is None or cached[0] is not itinerary:
+        blocks = [
+            (
+                # 使用正确的中文日期格式
+                f"第{day['day']}天（{day['date']} {day.get('day_name', '')}·{day['weather']}）",
+                "\n".join(f"- **{activity}**" for activity in day["activities"])
+            )
+            for day in itinerary["days"]
+        ]
+        cached = (itinerary, blocks)
+        st.session_state.itinerary_render = cached
+    return cached[1]
+
+# 行程永久链接存储（进程内共享）
+@st.cache_resource
+def get_plan_store():
+    """打开本地行程存储"""
+    return PlanStore()
+
+def itinerary_permalink(itinerary):
+    """保存行程并返回永久链接的键（同一行程只保存一次）"""
+    cached = st.session_state.get("itinerary_permalink")
+    if cached is None or cached[0] is not itinerary:
+        try:
+            key = get_plan_store().put({**itinerary, "location": st.session_state.get('location', '韶关')})
+        except Exception as e:
+            st.session_state.debug_info["行程存储错误"] = str(e)
+            return None
+        cached = (itinerary, key)
+        st.session_state.itinerary_permalink = cached
+    return cached[1]
+
+def render_days(itinerary):
+    """按天渲染行程"""
+    for title, activities in itinerary_blocks(itinerary):
+        with st.expander(title, expanded=True):
+            st.markdown(activities)
+
+# 通过永久链接打开的行程（直接从存储渲染，不加载数据目录、天气和规划器）
+def shared_plan_page(key):
+    """显示已保存的行程"""
+    try:
+        itinerary = get_plan_store().get(key)
+    except Exception as e:
+        st.error(f"行程读取失败: {str(e)}")
+        itinerary = None
+    
+    if itinerary is None:
+        st.title("个性化旅游攻略生成器")
+        st.warning("行程不存在或已过期，请重新生成")
+    else:
+        st.title(f"{itinerary['location']}个性化旅游攻略")
+        st.subheader(f"{len(itinerary['days'])}天{itinerary['theme']}行程（{itinerary['location']}）")
+        render_days(itinerary)
+    
+    if st.button("生成新的攻略"):
+        st.query_params.clear()
+        st.rerun()
+
+# 行程展示（片段：切换方案、按天气更新只重跑本片段）
+@st.fragment
+def itinerary_view():
+    """显示生成的行程"""
+    if not (st.session_state.get('itinerary') and st.session_state.itinerary_generated):
+        return
+    
+    st.divider()
+    itinerary = st.session_state.itinerary
+    st.subheader(f"{len(itinerary['days'])}天{itinerary.get('theme', '')}行程（{st.session_state.get('location', '韶关')}）")
+    
+    # 在已生成的备选方案之间切换
+    if len(st.session_state.itineraries) > 1:
+        st.radio(
+            "备选方案",
+            range(len(st.session_state.itineraries)),
+            format_func=lambda i: f"方案{i + 1}",
+            horizontal=True,
+            key="plan_index"
+        )
+        st.session_state.itinerary = st.session_state.itineraries[st.session_state.plan_index]
+    
+    # 天气预报变化时只重算受影响的日期
+    if st.button("按最新天气更新行程"):
+        with st.spinner("获取最新天气..."):
+            weather_data = get_amap_weather(st.session_state.get('location', '韶关'))
+        if weather_data.get("status") != "success":
+            st.error(f"天气API不可用: {weather_data.get('message', '未知错误')}")
+        else:
+            weather_data = fill_weather_gaps(
+                weather_data, st.session_state.get('location', '韶关'), len(st.session_state.itinerary["days"])
+            )
+            replanned = replan_itinerary(st.session_state.itinerary, weather_data, load_pois())
+            if replanned == []:
+                st.info("天气变化不影响行程安排，已刷新天气信息")
+            elif replanned:
+                st.success(f"已重新规划: {'、'.join(replanned)}")
+    
+    # 永久链接（打开时直接从存储渲染）
+    key = itinerary_permalink(st.session_state.itinerary)
+    if key:
+        st.markdown(f"🔗 分享链接: [?plan={key}](?plan={key})")
+    
+    render_days(st.session_state.itinerary)
+
+# 提示词预览（片段）
+@st.fragment
+def prompt_preview_panel():
+    """显示中英文提示词"""
+    st.divider()
+    st.subheader("提示词预览")
+    
+    try:
+        tab1, tab2 = st.tabs(["中文提示词", "English Prompt"])
+        
+        with tab1:
+            if st.session_state.prompt_content["chinese"]:
+                st.code(st.session_state.prompt_content["chinese"], language="text")
+            else:
+                st.warning("中文提示词内容为空")
+                st.info("请检查文件: prompt_template.txt")
+        
+        with tab2:
+            if st.session_state.prompt_content["english"]:
+                st.code(st.session_state.prompt_content["english"], language="text")
+            else:
+                st.warning("英文提示词内容为空")
+                st.info("请检查文件: prompt_template_en.txt")
+    except Exception as e:
+        st.error(f"提示词预览失败: {str(e)}")
+
+# 应用目录状态（短时缓存，避免每次重跑都访问文件系统）
+@st.cache_data(ttl=10)
+def scan_app_files(current_dir):
+    """列出应用目录并检查secrets和提示词文件是否存在"""
+    files = [f for f in os.listdir(current_dir) if not f.startswith(".") and not f.endswith("tmp")]
+    paths = {
+        "secrets": os.path.join(current_dir, "secrets.toml"),
+        "chinese": os.path.join(current_dir, "prompt_template.txt"),
+        "english": os.path.join(current_dir, "prompt_template_en.txt"),
+    }
+    return files, {name: (path, os.path.exists(path)) for name, path in paths.items()}
+
+# 调试信息（片段：重新加载数据只重跑本片段）
+@st.fragment
+def debug_panel():
+    """显示调试信息和文件状态"""
+    st.divider()
+    st.subheader("调试信息")
+    
+    # 更新当前时间
+    st.session_state.debug_info["当前时间"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # 只显示有效信息
+    valid_debug_info = {}
+    for key, value in st.session_state.debug_info.items():
+        if value and not str(value).startswith("<") and not str(value).endswith(">"):
+            valid_debug_info[key] = value
+    
+    # 显示调试信息
+    st.markdown("\n\n".join(f"**{key}**: `{value}`" for key, value in valid_debug_info.items()))
+    
+    # 手动重新加载数据（后台重建后原子替换，不影响进行中的请求）
+    if st.button("重新加载数据"):
+        store = get_catalog_store()
+        if store.reload(force=True):
+            st.success(f"数据已更新至版本 {store.current().version}")
+        else:
+            st.warning(f"数据未更新: {store.last_error or '重新加载正在进行中'}")
+    
+    # 显示文件结构（过滤无效条目）
+    st.markdown("**当前目录结构**:")
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        files, status = scan_app_files(current_dir)
+        st.code("\n".join(files), language="plaintext")
+        
+        def exists_label(name):
+            return "✅ 存在" if status[name][1] else "❌ 不存在"
+        
+        # 显示Secrets文件状态
+        st.markdown("**Secrets文件状态**:")
+        st.markdown(f"- secrets.toml: `{status['secrets'][0]}` - {exists_label('secrets')}")
+        
+        # 显示提示词文件状态
+        st.markdown("**提示词文件状态**:")
+        st.markdown(f"- 中文提示词: `{status['chinese'][0]}` - {exists_label('chinese')}")
+        st.markdown(f"- 英文提示词: `{status['english'][0]}` - {exists_label('english')}")
+    except Exception as e:
+        st.error(f"无法列出目录: {str(e)}")
+
+# 主应用界面（页面各部分拆分为可独立重跑的片段，只有修改地点和显示选项时才整页重跑）
 def main():
+    # 通过永久链接打开时只读取存储
+    plan_key = st.query_params.get("plan")
+    if plan_key:
+        shared_plan_page(plan_key)
+        return
+    
+    # 预热进程级共享资源
+    warm_up_shared_resources()
+    
     # 首先加载Secrets
     if not st.session_state.secrets_loaded:
         with st.spinner("加载API配置..."):
@@ -315,37 +649,20 @@ def main():
         
         # 位置选择
         location = st.text_input("旅行地点", "韶关")
-        
-        # 状态检查
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("检查DeepSeek状态"):
-                st.success("DeepSeek API 连接正常！")
-        
-        with col2:
-            if st.button("检查天气API状态"):
-                with st.spinner("检查天气API..."):
-                    weather_data = get_amap_weather(location)
-                    if weather_data.get("status") == "success":
-                        st.success(f"天气API可用（更新时间: {weather_data.get('report_time', '未知')}）")
-                    else:
-                        st.error(f"天气API不可用: {weather_data.get('message', '未知错误')}")
-        
-        # 添加验证API密钥的按钮
-        if st.button("验证API密钥"):
-            # 检查是否已加载secrets且包含AMAP_API_KEY
-            if not hasattr(st.session_state, 'secrets') or "AMAP_API_KEY" not in st.session_state.secrets:
-                st.error("未找到API密钥配置")
+        resolver = get_location_resolver()
+        resolved = resolver.resolve(location)
+        if resolved is None:
+            suggestions = location_suggestions(location)
+            if suggestions:
+                st.caption("您是否要找：" + "、".join(suggestions))
             else:
-                # 此时确保存在密钥
-                key = st.session_state.secrets["AMAP_API_KEY"]
-                st.info(f"当前密钥: {key[:4]}...{key[-4:]}")
-                
-                # 简单验证密钥格式
-                if len(key) != 32:
-                    st.error("密钥长度应为32字符")
-                else:
-                    st.success("密钥格式正确")
+                st.warning(f"无法识别的地点: {location}")
+        elif not resolved.exact:
+            st.caption(f"已按「{resolved.full_name}」查询")
+        if resolved is not None and not get_climatology().covers(resolved.region.adcode):
+            st.caption(f"「{resolved.full_name}」暂无历史同期气候数据，天气预报范围（约 4 天）以外的日期按未知天气安排")
+        
+        sidebar_tools(location)
         
         # 显示选项
         st.session_state.prompt_preview = st.checkbox("显示提示词预览", value=st.session_state.prompt_preview)
@@ -359,118 +676,18 @@ def main():
     st.title(f"{location}个性化旅游攻略生成器")
     
     # 用户输入区域
-    with st.form("travel_form"):
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            travel_days = st.slider("行程天数", 1, 7, 3)
-        
-        with col2:
-            travel_theme = st.selectbox(
-                "旅行主题",
-                ["历史人文", "自然风光", "美食探索", "文化体验", "家庭亲子"],
-                index=0
-            )
-        
-        if st.form_submit_button("一键生成攻略", use_container_width=True):
-            with st.spinner("AI 正在规划行程..."):
-                # 加载数据
-                attractions, foods, culture = load_data()
-                
-                # 获取天气
-                weather_data = get_amap_weather(location)
-                
-                # 生成行程
-                itinerary = generate_itinerary(travel_days, travel_theme, weather_data)
-                
-                # 保存结果
-                if itinerary.get("status") == "success":
-                    st.session_state.itinerary = itinerary
-                    st.session_state.location = location
-                    st.success("攻略生成成功！")
-                else:
-                    st.error("攻略生成失败，请重试或检查API设置")
+    travel_form(location)
     
-    # 显示生成的行程 - 修复日期显示问题
-    if st.session_state.get('itinerary') and st.session_state.itinerary_generated:
-        st.divider()
-        st.subheader(f"{travel_days}天{travel_theme}行程（{st.session_state.get('location', '韶关')}）")
-        
-        for day in st.session_state.itinerary["days"]:
-            # 使用正确的中文日期格式
-            title = f"第{day['day']}天（{day['date']} {day.get('day_name', '')}·{day['weather']}）"
-            
-            with st.expander(title, expanded=True):
-                for activity in day["activities"]:
-                    st.markdown(f"- **{activity}**")
+    # 显示生成的行程
+    itinerary_view()
     
     # 显示提示词预览
     if st.session_state.prompt_preview:
-        st.divider()
-        st.subheader("提示词预览")
-        
-        try:
-            tab1, tab2 = st.tabs(["中文提示词", "English Prompt"])
-            
-            with tab1:
-                if st.session_state.prompt_content["chinese"]:
-                    st.code(st.session_state.prompt_content["chinese"], language="text")
-                else:
-                    st.warning("中文提示词内容为空")
-                    st.info("请检查文件: prompt_template.txt")
-            
-            with tab2:
-                if st.session_state.prompt_content["english"]:
-                    st.code(st.session_state.prompt_content["english"], language="text")
-                else:
-                    st.warning("英文提示词内容为空")
-                    st.info("请检查文件: prompt_template_en.txt")
-        except Exception as e:
-            st.error(f"提示词预览失败: {str(e)}")
+        prompt_preview_panel()
     
     # 显示调试信息
     if show_debug:
-        st.divider()
-        st.subheader("调试信息")
-        
-        # 更新当前时间
-        st.session_state.debug_info["当前时间"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # 只显示有效信息
-        valid_debug_info = {}
-        for key, value in st.session_state.debug_info.items():
-            if value and not str(value).startswith("<") and not str(value).endswith(">"):
-                valid_debug_info[key] = value
-        
-        # 显示调试信息
-        for key, value in valid_debug_info.items():
-            st.markdown(f"**{key}**: `{value}`")
-        
-        # 显示文件结构（过滤无效条目）
-        st.markdown("**当前目录结构**:")
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        try:
-            files = [f for f in os.listdir(current_dir) if not f.startswith(".") and not f.endswith("tmp")]
-            st.code("\n".join(files), language="plaintext")
-            
-            # 显示Secrets文件状态
-            st.markdown("**Secrets文件状态**:")
-            secrets_path = os.path.join(current_dir, "secrets.toml")
-            secrets_exists = "✅ 存在" if os.path.exists(secrets_path) else "❌ 不存在"
-            st.markdown(f"- secrets.toml: `{secrets_path}` - {secrets_exists}")
-            
-            # 显示提示词文件状态
-            st.markdown("**提示词文件状态**:")
-            chinese_path = os.path.join(current_dir, "prompt_template.txt")
-            english_path = os.path.join(current_dir, "prompt_template_en.txt")
-            
-            chinese_exists = "✅ 存在" if os.path.exists(chinese_path) else "❌ 不存在"
-            english_exists = "✅ 存在" if os.path.exists(english_path) else "❌ 不存在"
-            
-            st.markdown(f"- 中文提示词: `{chinese_path}` - {chinese_exists}")
-            st.markdown(f"- 英文提示词: `{english_path}` - {english_exists}")
-        except Exception as e:
-            st.error(f"无法列出目录: {str(e)}")
+        debug_panel()
 
 if __name__ == "__main__":
     main()
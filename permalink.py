@@ -0,0 +1,191 @@
+"""
+行程永久链接
+- 行程编码为紧凑的内容寻址格式：用到的地点表（唯一编码、名称、说明）+ 每天的元数据，msgpack 序列化
+- 键为编码结果的 BLAKE2 摘要（12 位 base32），相同行程总是得到相同的键
+- 存储在本地 SQLite 键值表中，总大小超过上限时按最近访问时间淘汰
+- 通过链接打开时直接从存储解码渲染，不需要数据目录、天气和规划器
+"""
+
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+import msgpack
+
+from planner import DAY_NAMES, DAY_SLOTS, weather_branch
+
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_store.sqlite3")
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024  # 存储总大小上限
+
+FORMAT_VERSION = 1
+KEY_BYTES = 7  # 56 位摘要，base32 去掉填充后 12 个字符
+
+
+def _activity_text(slot_index, poi):
+    slot = DAY_SLOTS[slot_index][0] if slot_index < len(DAY_SLOTS) else ""
+    _, name, note = poi
+    return f"{slot}: {name}（{note}）" if note else f"{slot}: {name}"
+
+
+def encode_itinerary(itinerary):
+    """把行程编码为 msgpack 字节串
+
+    结构：[版本, 主题, 地点, 首日日期, 地点表, 每天]
+    地点表每项为 [唯一编码, 名称, 说明]；每天为 [相对首日的天数, 天气显示, 天气, 活动列表, 地点名称, 降雨概率]，
+    活动能由时段和地点表还原时记为地点表下标，否则（自由活动、模板行程）保存原文；
+    地点名称只在模板行程（没有唯一编码）时保存。
+    """
+    days = itinerary["days"]
+    first = date.fromisoformat(days[0]["date"]) if days else date.today()
+
+    poi_table, poi_index = [], {}
+    encoded_days = []
+    for day in days:
+        depends_on = day.get("depends_on", {})
+        ids = iter(depends_on.get("poi_ids", []))
+        names = iter(depends_on.get("pois", []))
+        activities = []
+        for slot_index, text in enumerate(day["activities"]):
+            encoded = text
+            if ": 自由活动" not in text and depends_on.get("poi_ids"):
+                poi_id, name = next(ids, None), next(names, None)
+                if poi_id is not None:
+                    prefix = _activity_text(slot_index, (poi_id, name, ""))
+                    note = text[len(prefix) + 1:-1] if text.startswith(prefix + "（") and text.endswith("）") else ""
+                    poi = (poi_id, name, note)
+                    if _activity_text(slot_index, poi) == text:
+                        if poi not in poi_index:
+                            poi_index[poi] = len(poi_table)
+                            poi_table.append(list(poi))
+                        encoded = poi_index[poi]
+            activities.append(encoded)
+        encoded_days.append([
+            (date.fromisoformat(day["date"]) - first).days,
+            day["weather"],
+            depends_on.get("condition", ""),
+            activities,
+            [] if depends_on.get("poi_ids") else depends_on.get("pois", []),
+            depends_on.get("rain_prob"),
+        ])
+
+    return msgpack.packb(
+        [FORMAT_VERSION, itinerary.get("theme", ""), itinerary.get("location", ""),
+         first.isoformat(), poi_table, encoded_days],
+        use_bin_type=True
+    )
+
+
+def decode_itinerary(payload):
+    """把 encode_itinerary 的结果还原为行程（与规划器输出的结构一致）"""
+    version, theme, location, first, poi_table, encoded_days = msgpack.unpackb(payload, raw=False)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的行程格式版本: {version}")
+    first = date.fromisoformat(first)
+
+    days = []
+    for i, (offset, weather, condition, activities, template_names, *rest) in enumerate(encoded_days):
+        day_date = first + timedelta(days=offset)
+        rain_prob = rest[0] if rest else None
+        texts, names, ids = [], [], []
+        for slot_index, activity in enumerate(activities):
+            if isinstance(activity, int):
+                poi = poi_table[activity]
+                texts.append(_activity_text(slot_index, poi))
+                ids.append(poi[0])
+                names.append(poi[1])
+            else:
+                texts.append(activity)
+        days.append({
+            "date": day_date.isoformat(),
+            "day": i + 1,
+            "day_name": DAY_NAMES[day_date.weekday()],
+            "weather": weather,
+            "activities": texts,
+            "depends_on": {
+                "condition": condition,
+                "rain_prob": rain_prob,
+                "branch": weather_branch(condition, rain_prob),
+                "weekday": day_date.weekday(),
+                "pois": names or template_names,
+                "poi_ids": ids,
+            }
+        })
+
+    return {"status": "success", "theme": theme, "location": location, "days": days}
+
+
+def plan_key(payload):
+    """内容地址：编码结果的 BLAKE2 摘要"""
+    digest = hashlib.blake2b(payload, digest_size=KEY_BYTES).digest()
+    return base64.b32encode(digest).decode("ascii").rstrip("=").lower()
+
+
+class PlanStore:
+    """行程键值存储（SQLite），总大小超过上限时淘汰最久未访问的行程"""
+
+    def __init__(self, path=STORE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS plans_accessed ON plans (accessed)")
+
+    def _connect(self):
+        """每个线程一个连接（Streamlit 每个会话的脚本在不同线程中运行）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, itinerary):
+        """保存行程并返回其键；内容相同的行程只保存一份"""
+        payload = encode_itinerary(itinerary)
+        key = plan_key(payload)
+        now = time.time()
+        with self._connect() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO plans (key, payload, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            ).rowcount
+            if inserted:
+                self._evict(conn)
+            else:
+                conn.execute("UPDATE plans SET accessed = ? WHERE key = ?", (now, key))
+        return key
+
+    def get(self, key):
+        """按键读取行程，不存在时返回 None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM plans WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE plans SET accessed = ? WHERE key = ?", (time.time(), key))
+        return decode_itinerary(row[0])
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM plans").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM plans ORDER BY accessed").fetchall():
+            if total - evicted <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+            evicted += size
+
+    def stats(self):
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM plans").fetchone()
+        return {"plans": count, "bytes": total, "max_bytes": self.max_bytes}
@@ -0,0 +1,440 @@
+"""
+韶关行程规划
+- 按天气分支（雨 / 晴 / 其他）、旅行主题和开放日为每个时段挑选景点、餐厅和文化体验
+- 降雨按概率处理：预报天气按天气现象估计降雨概率，预报范围外的日期使用历史同期气候概率，
+  候选得分取雨天与非雨天得分的期望
+- 集束搜索（beam search）一次生成 K 个备选方案：候选打分与开放日检查按 (分支, 星期, 时段) 计算一次，
+  所有集束共享；分组之间对重复的地点加罚分以保证方案差异
+- 每天记录其依赖的输入（日期、星期、天气分支、所选景点），供增量重规划使用
+- replan_itinerary 对比新旧天气预报，只重算天气分支发生变化的日期
+- 数据目录为空时退回内置的分支模板
+"""
+
+import heapq
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+import pandas as pd
+import pytz
+
+TIMEZONE = pytz.timezone('Asia/Shanghai')
+DAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+WEEKDAY_INDEX = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+
+UNKNOWN_WEATHER = {
+    "condition": "未知",
+    "temp_max": "未知",
+    "temp_min": "未知"
+}
+
+# 数据目录为空时使用的分支模板：(时段, 地点, 说明)
+BRANCH_PLANS = {
+    "雨": [
+        ("上午", "南华寺", "室内活动，参拜六祖真身"),
+        ("午餐", "南华寺素食馆", "人均64元·推荐普度斋"),
+        ("下午", "韶关博物馆", "了解本地历史"),
+        ("傍晚", "非遗工坊体验", "瑶族传统工艺"),
+    ],
+    "晴": [
+        ("上午", "丹霞山", "世界自然遗产"),
+        ("午餐", "农家乐", "人均50元·推荐丹霞豆腐"),
+        ("下午", "古佛岩", "喀斯特地貌"),
+        ("傍晚", "温泉体验", "推荐经律论温泉"),
+    ],
+    "其他": [
+        ("上午", "珠玑古巷", "千年古道"),
+        ("午餐", "百年老店", "人均60元·推荐梅菜扣肉"),
+        ("下午", "梅关古道", "历史遗迹"),
+        ("傍晚", "当地夜市体验", "品尝特色小吃"),
+    ],
+}
+
+# 每天的时段及可选的地点类型
+DAY_SLOTS = [
+    ("上午", ("attraction",)),
+    ("午餐", ("food",)),
+    ("下午", ("attraction", "culture")),
+    ("傍晚", ("culture", "food")),
+]
+
+# 旅行主题偏好的地点类型 / 子类
+THEME_TAGS = {
+    "历史人文": {"attraction:历史", "culture:传统戏剧", "culture:民俗"},
+    "自然风光": {"attraction:自然"},
+    "美食探索": {"food:*", "culture:传统技艺"},
+    "文化体验": {"culture:*"},
+    "家庭亲子": {"attraction:亲子", "culture:传统舞蹈", "culture:民俗", "culture:手工艺"},
+}
+
+# 室内类子类（雨天加分）
+INDOOR_SUBTYPES = {"attraction:历史", "food:*", "culture:传统技艺", "culture:手工艺", "culture:传统戏剧"}
+
+# 预报天气现象对应的降雨概率（按顺序匹配）
+FORECAST_RAIN_PROB = [
+    ("阵雨", 0.6),
+    ("雨", 0.9),
+    ("阴", 0.3),
+    ("云", 0.15),
+    ("晴", 0.05),
+]
+RAIN_THRESHOLD = 0.5      # 降雨概率达到该值时按雨天分支记录
+RAIN_PROB_STEP = 0.1      # 候选缓存按该粒度对降雨概率分桶
+
+# 打分与搜索参数
+CANDIDATES_PER_SLOT = 12  # 每个时段保留的候选数（过少时备选方案只能在同一批地点间换时段）
+BEAM_WIDTH = 4            # 最优方案的集束宽度
+ALT_BEAM_WIDTH = 2        # 备选方案的集束宽度（差异罚分已主导其选择，窄集束即可）
+REPEAT_PENALTY = 2.0      # 同一方案内重复地点的罚分
+DIVERSITY_PENALTY = 0.5   # 与其他方案重复地点的罚分（按 scripts/bench_alternatives.py 的地点集合重合度调整）
+
+
+def rain_probability(day_weather):
+    """当天的降雨概率：气候数据直接给出，预报按天气现象估计，未知天气返回 None"""
+    if day_weather.get("rain_prob") is not None:
+        return float(day_weather["rain_prob"])
+    condition = day_weather.get("condition", "")
+    for keyword, probability in FORECAST_RAIN_PROB:
+        if keyword in condition:
+            return probability
+    return None
+
+
+def dry_branch(condition):
+    """不下雨时的规划分支"""
+    return "晴" if "晴" in condition else "其他"
+
+
+def weather_branch(condition, rain_prob=None):
+    """天气对应的规划分支（降雨概率达到阈值时为雨天）"""
+    if rain_prob is None:
+        return "雨" if "雨" in condition else dry_branch(condition)
+    return "雨" if rain_prob >= RAIN_THRESHOLD else dry_branch(condition)
+
+
+def day_branch(day_weather):
+    return weather_branch(day_weather["condition"], rain_probability(day_weather))
+
+
+def find_day_weather(weather_data, date_str):
+    """查找指定日期的天气预报，没有时返回默认值"""
+    for forecast in weather_data.get("forecast", []):
+        if forecast.get("date") == date_str:
+            return forecast
+    return dict(UNKNOWN_WEATHER)
+
+
+def format_weather(day_weather):
+    text = f"{day_weather['condition']}·{day_weather['temp_min']}~{day_weather['temp_max']}℃"
+    if day_weather.get("source") == "climatology":
+        text += f"·降雨概率{float(day_weather['rain_prob']):.0%}"
+    return text
+
+
+def parse_closed_weekdays(text):
+    """从开放时间描述中解析闭馆的星期（如"周二至周日" → {0}）"""
+    if not isinstance(text, str):
+        return frozenset()
+    match = re.search(r"[周星期]+([一二三四五六日天])\s*[至到\-~]\s*[周星期]*([一二三四五六日天])", text)
+    if match:
+        start, end = WEEKDAY_INDEX[match.group(1)], WEEKDAY_INDEX[match.group(2)]
+        open_days = {(start + i) % 7 for i in range((end - start) % 7 + 1)}
+        return frozenset(set(range(7)) - open_days)
+    closed = re.findall(r"[周星期]+([一二三四五六日天])\s*(?:闭馆|休息|休馆|不开放)", text)
+    return frozenset(WEEKDAY_INDEX[d] for d in closed)
+
+
+def _text(value):
+    return "" if pd.isna(value) else str(value).strip()
+
+
+def build_pois(attractions, foods, culture):
+    """把数据目录转换为规划用的地点列表"""
+    pois = []
+
+    for _, row in attractions.iterrows():
+        subtype = _text(row.get("主类型")).split("/")[0]
+        pois.append({
+            "id": _text(row.get("唯一编码")),
+            "name": _text(row.get("名称")),
+            "kind": "attraction",
+            "tag": f"attraction:{subtype}",
+            "quality": 0.5,
+            "closed": parse_closed_weekdays(row.get("开放时间段")),
+            "note": _text(row.get("景点特色说明")).split("，")[0],
+        })
+
+    for _, row in foods.iterrows():
+        dishes = [d for d in _text(row.get("特色菜")).split("、") if d]
+        rating = pd.to_numeric(row.get("评分"), errors="coerce")
+        pois.append({
+            "id": _text(row.get("唯一编码")),
+            "name": _text(row.get("店名")),
+            "kind": "food",
+            "tag": f"food:{_text(row.get('类型'))}",
+            "quality": 0.5 if pd.isna(rating) else (rating - 3) / 2,
+            "closed": frozenset(),
+            "note": f"人均{_text(row.get('人均消费'))}元" + (f"·推荐{dishes[0]}" if dishes else ""),
+        })
+
+    for _, row in culture.iterrows():
+        pois.append({
+            "id": _text(row.get("唯一编码")),
+            "name": _text(row.get("名称")),
+            "kind": "culture",
+            "tag": f"culture:{_text(row.get('类别'))}",
+            "quality": 0.5,
+            "closed": frozenset(),
+            "note": "·".join(p for p in (_text(row.get("类别")), _text(row.get("传承地"))) if p),
+        })
+
+    return [poi for poi in pois if poi["name"]]
+
+
+def _matches(tag, tags):
+    return tag in tags or f"{tag.split(':')[0]}:*" in tags
+
+
+def score_poi(quality, indoor, theme_match, branch):
+    """地点在给定天气分支下的基础得分（质量 + 室内外适宜度 + 主题匹配）"""
+    score = quality
+    if branch == "雨":
+        score += 1.0 if indoor else -1.0
+    elif branch == "晴":
+        score += 0.0 if indoor else 1.0
+    if theme_match:
+        score += 1.0
+    return score
+
+
+def expected_score(quality, indoor, theme_match, dry, rain_prob):
+    """按降雨概率对雨天 / 非雨天得分取期望；概率未知时按非雨天分支打分"""
+    if rain_prob is None:
+        return score_poi(quality, indoor, theme_match, dry)
+    return (rain_prob * score_poi(quality, indoor, theme_match, "雨")
+            + (1 - rain_prob) * score_poi(quality, indoor, theme_match, dry))
+
+
+def weather_key(day_weather):
+    """候选缓存使用的天气键：(非雨天分支, 分桶后的降雨概率)"""
+    rain_prob = rain_probability(day_weather)
+    if rain_prob is not None:
+        rain_prob = round(round(rain_prob / RAIN_PROB_STEP) * RAIN_PROB_STEP, 2)
+    return dry_branch(day_weather["condition"]), rain_prob
+
+
+class CandidateCache:
+    """候选打分与开放日检查结果，按 (天气键, 星期, 时段) 缓存，所有集束和方案共享"""
+
+    def __init__(self, pois, theme):
+        self.pois = pois
+        self.theme = theme
+        self._cache = {}
+        # 与天气、日期无关的特征只计算一次
+        theme_tags = THEME_TAGS.get(theme, set())
+        self._features = [
+            (poi["kind"], poi["closed"], poi["quality"],
+             _matches(poi["tag"], INDOOR_SUBTYPES), _matches(poi["tag"], theme_tags))
+            for poi in pois
+        ]
+
+    def get(self, weather, weekday, slot_index):
+        key = (weather, weekday, slot_index)
+        if key not in self._cache:
+            kinds = DAY_SLOTS[slot_index][1]
+            dry, rain_prob = weather
+            scored = [
+                (expected_score(quality, indoor, theme_match, dry, rain_prob), i)
+                for i, (kind, closed, quality, indoor, theme_match) in enumerate(self._features)
+                if kind in kinds and weekday not in closed
+            ]
+            scored.sort(key=lambda item: -item[0])
+            self._cache[key] = scored[:CANDIDATES_PER_SLOT]
+        return self._cache[key]
+
+
+def beam_search(steps, k, initial_counts=None):
+    """分组集束搜索，返回 k 组最优的地点序列（每组一个）
+
+    steps 为每一步的候选列表 [(基础得分, 地点下标), ...]；各组依次完整搜索，
+    第 g 组对前 g 组最优方案中出现过的地点（无论在哪一天、哪个时段）加 DIVERSITY_PENALTY 罚分，
+    避免备选方案只是把同一批地点换到别的时段。
+    """
+    initial_counts = dict(initial_counts or {})
+    prior_usage = {}
+    results = []
+
+    for g in range(k):
+        width = BEAM_WIDTH if g == 0 else ALT_BEAM_WIDTH
+        beams = [(0.0, (), initial_counts)]
+        for candidates in steps:
+            expanded = []
+            for score, chosen, counts in beams:
+                if not candidates:
+                    expanded.append((score, chosen, counts, None))
+                    continue
+                for base, poi in candidates:
+                    total = (score + base - REPEAT_PENALTY * counts.get(poi, 0)
+                             - DIVERSITY_PENALTY * prior_usage.get(poi, 0))
+                    expanded.append((total, chosen, counts, poi))
+
+            beams = []
+            for total, chosen, counts, poi in heapq.nlargest(width, expanded, key=itemgetter(0)):
+                # 只为保留下来的集束复制序列和计数
+                if poi is not None:
+                    counts = {**counts, poi: counts.get(poi, 0) + 1}
+                beams.append((total, chosen + (poi,), counts))
+
+        # 本组最优方案中的全部地点供后续组计算差异罚分
+        results.append(beams[0])
+        for poi in beams[0][1]:
+            if poi is not None:
+                prior_usage[poi] = prior_usage.get(poi, 0) + 1
+
+    return results
+
+
+def _template_day(day_weather):
+    branch = day_branch(day_weather)
+    plan = BRANCH_PLANS[branch]
+    activities = [f"{slot}: {place}（{note}）" for slot, place, note in plan]
+    return branch, activities, [place for _, place, _ in plan], []
+
+
+def _day_record(day_index, day_date, day_weather, activities, poi_names, poi_ids):
+    return {
+        "date": day_date.strftime("%Y-%m-%d"),
+        "day": day_index + 1,
+        "day_name": DAY_NAMES[day_date.weekday()],
+        "weather": format_weather(day_weather),
+        "activities": activities,
+        "depends_on": {
+            "condition": day_weather["condition"],
+            "rain_prob": rain_probability(day_weather),
+            "branch": day_branch(day_weather),
+            "weekday": day_date.weekday(),  # 开放日约束
+            "pois": poi_names,
+            "poi_ids": poi_ids,
+        }
+    }
+
+
+def _days_from_choice(pois, day_contexts, chosen):
+    """把集束搜索得到的地点序列展开为每天的行程"""
+    days = []
+    slots_per_day = len(DAY_SLOTS)
+    for day_index, (day_date, day_weather) in enumerate(day_contexts):
+        activities, names, ids = [], [], []
+        for slot_index, (slot, _) in enumerate(DAY_SLOTS):
+            poi_index = chosen[day_index * slots_per_day + slot_index]
+            if poi_index is None:
+                activities.append(f"{slot}: 自由活动")
+                continue
+            poi = pois[poi_index]
+            activities.append(f"{slot}: {poi['name']}（{poi['note']}）" if poi["note"] else f"{slot}: {poi['name']}")
+            names.append(poi["name"])
+            ids.append(poi["id"])
+        days.append(_day_record(day_index, day_date, day_weather, activities, names, ids))
+    return days
+
+
+def _plan_steps(cache, day_contexts):
+    steps = []
+    for day_date, day_weather in day_contexts:
+        weather = weather_key(day_weather)
+        for slot_index in range(len(DAY_SLOTS)):
+            steps.append(cache.get(weather, day_date.weekday(), slot_index))
+    return steps
+
+
+def generate_alternatives(days, theme, weather_data, pois=None, k=5, start_date=None):
+    """一次生成 k 个互有差异的备选行程（第一个为最优方案）"""
+    if start_date is None:
+        start_date = datetime.now(TIMEZONE)
+
+    day_contexts = []
+    for i in range(days):
+        day_date = start_date + timedelta(days=i)
+        day_contexts.append((day_date, find_day_weather(weather_data, day_date.strftime("%Y-%m-%d"))))
+
+    base = {
+        "status": "success",
+        "theme": theme,
+        "location": weather_data.get("location", ""),
+        "report_time": weather_data.get("report_time", ""),
+    }
+
+    # 数据目录为空时只有模板方案
+    if not pois:
+        template_days = []
+        for i, (day_date, day_weather) in enumerate(day_contexts):
+            _, activities, names, ids = _template_day(day_weather)
+            template_days.append(_day_record(i, day_date, day_weather, activities, names, ids))
+        return [{**base, "score": 0.0, "days": template_days}]
+
+    cache = CandidateCache(pois, theme)
+    results = beam_search(_plan_steps(cache, day_contexts), k)
+
+    alternatives = []
+    seen = set()
+    for score, chosen, _ in results:
+        if chosen in seen:
+            continue
+        seen.add(chosen)
+        alternatives.append({**base, "score": round(score, 2), "days": _days_from_choice(pois, day_contexts, chosen)})
+    return alternatives
+
+
+def generate_itinerary(days, theme, weather_data, pois=None, start_date=None):
+    """生成单个最优行程"""
+    return generate_alternatives(days, theme, weather_data, pois, k=1, start_date=start_date)[0]
+
+
+def replan_itinerary(itinerary, weather_data, pois=None):
+    """根据新的天气预报增量更新行程
+
+    天气分支未变化的日期保留原有活动，仅刷新天气显示；分支变化的日期重新规划，
+    并对其余日期已安排的地点计重复罚分。返回 (新行程, 重新规划的日期列表)
+    """
+    new_days = []
+    changed = []
+    for i, day in enumerate(itinerary["days"]):
+        day_weather = find_day_weather(weather_data, day["date"])
+        if day_branch(day_weather) == day.get("depends_on", {}).get("branch"):
+            new_days.append({
+                **day,
+                "weather": format_weather(day_weather),
+                "depends_on": {
+                    **day["depends_on"],
+                    "condition": day_weather["condition"],
+                    "rain_prob": rain_probability(day_weather)
+                }
+            })
+        else:
+            new_days.append(None)
+            changed.append((i, datetime.strptime(day["date"], "%Y-%m-%d"), day_weather))
+
+    if changed and pois:
+        id_index = {poi["id"]: i for i, poi in enumerate(pois)}
+        kept_counts = Counter(
+            id_index[poi_id]
+            for day in new_days if day is not None
+            for poi_id in day["depends_on"].get("poi_ids", []) if poi_id in id_index
+        )
+        cache = CandidateCache(pois, itinerary.get("theme", ""))
+        day_contexts = [(day_date, day_weather) for _, day_date, day_weather in changed]
+        _, chosen, _ = beam_search(_plan_steps(cache, day_contexts), 1, kept_counts)[0]
+        for (i, _, _), day in zip(changed, _days_from_choice(pois, day_contexts, chosen)):
+            new_days[i] = {**day, "day": i + 1}
+    else:
+        for i, day_date, day_weather in changed:
+            _, activities, names, ids = _template_day(day_weather)
+            new_days[i] = _day_record(i, day_date, day_weather, activities, names, ids)
+
+    new_itinerary = {
+        **itinerary,
+        "report_time": weather_data.get("report_time", itinerary.get("report_time", "")),
+        "days": new_days
+    }
+    return new_itinerary, [new_days[i]["date"] for i, _, _ in changed]
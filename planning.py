@@ -0,0 +1,110 @@
+"""
+行程规划流程（不依赖 Streamlit）
+- "一键生成攻略"的各步骤：离线地点解析 → 高德天气（经配额管理器）→ 历史同期气候补齐 → 生成备选行程 → 保存永久链接
+- main.py 的页面和 scripts/replay_traffic.py 的压测调用同一组函数，页面只负责缓存资源、显示状态和调试信息
+- 各步骤耗时记录在结果的 timings 中（秒）
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import planner
+
+WEATHER_PATH = "/v3/weather/weatherInfo"
+
+
+@dataclass
+class PlanResult:
+    """一次规划的结果；weather 为补齐前的高德天气，weather_data 为补齐后用于规划的天气"""
+    location: str
+    resolved: object
+    weather: dict
+    weather_data: dict
+    climatology: str
+    alternatives: list
+    key: str = None
+    store_error: str = ""
+    timings: dict = field(default_factory=dict)
+
+
+def fetch_weather(manager, resolved, location):
+    """经配额管理器请求高德天气预报，解析为规划使用的格式"""
+    if manager is None or not manager.keys:
+        return {"status": "error", "message": "API密钥未配置"}
+    try:
+        # 构建请求参数（密钥由配额管理器选择）
+        params = {
+            "city": resolved.region.adcode,
+            "extensions": "all",  # 获取预报天气
+            "output": "JSON"
+        }
+        weather_data = manager.request(WEATHER_PATH, params, timeout=10)
+
+        if weather_data.get("status") != "1":
+            return {"status": "error", "message": weather_data.get("info", "未知错误")}
+        forecasts = weather_data.get("forecasts", [])
+        if not forecasts:
+            return {"status": "error", "message": "无预报数据"}
+
+        return {
+            "status": "success",
+            "location": location,
+            "report_time": forecasts[0].get("reporttime", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            "forecast": [
+                {
+                    "date": cast.get("date"),
+                    "condition": cast.get("dayweather", "未知"),
+                    "temp_max": cast.get("daytemp", "未知"),
+                    "temp_min": cast.get("nighttemp", "未知")
+                }
+                for cast in forecasts[0].get("casts", [])
+            ]
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+def fill_weather_gaps(climatology, weather_data, resolved, days, start_date=None):
+    """预报未覆盖的日期用历史同期气候补齐（不发起额外请求），返回 (天气数据, 补齐说明)"""
+    adcode = resolved.region.adcode
+    if not climatology.covers(adcode):
+        return weather_data, f"无 {adcode} 的历史同期气候数据，未补齐"
+    if start_date is None:
+        start_date = datetime.now(planner.TIMEZONE)
+    filled = climatology.fill_forecast(weather_data, adcode, days, start_date)
+    return filled, f"{filled.get('climatology_days', 0)} 天"
+
+
+def plan_trip(location, days, theme, pois, resolver, climatology, manager, store=None, k=5, start_date=None):
+    """执行一次"一键生成攻略"，返回 PlanResult（规划失败时抛出异常，永久链接保存失败只记录在 store_error）
+
+    无法识别的地点不请求天气、不生成行程，返回的 alternatives 为空列表。
+    """
+    timings = {}
+
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    # 无法识别的地点不发起请求，也不生成行程
+    resolved = timed("地点解析", resolver.resolve, location)
+    if resolved is None:
+        weather = {"status": "error", "message": f"无法识别的地点: {location}"}
+        return PlanResult(location, None, weather, weather, "", [], timings=timings)
+
+    weather = timed("高德天气", fetch_weather, manager, resolved, location)
+    weather_data, note = timed("气候补齐", fill_weather_gaps, climatology, weather, resolved, days, start_date)
+
+    alternatives = timed("规划", planner.generate_alternatives, days, theme, weather_data, pois,
+                         k=k, start_date=start_date)
+    result = PlanResult(location, resolved, weather, weather_data, note, alternatives, timings=timings)
+
+    if store is not None:
+        try:
+            result.key = timed("永久链接", store.put, {**alternatives[0], "location": location})
+        except Exception as e:
+            result.store_error = str(e)
+    return result
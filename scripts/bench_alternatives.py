@@ -0,0 +1,73 @@
+﻿"""
+一次生成 K 个备选方案与单个方案的耗时对比
+- 仅规划：地点列表已按数据版本缓存时的集束搜索耗时
+- 含数据准备：每次点击都重新构建地点列表（即分别点击 K 次"一键生成攻略"的情形）
+- 方案差异：两两方案所用地点集合的 Jaccard 重合度（与时段无关，同一批地点换时段仍算重复），
+  分别统计表单默认的 3 天行程和 DAYS 天行程
+"""
+
+import itertools
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+import planner  # noqa: E402
+from catalog import build_snapshot  # noqa: E402
+
+DAYS = 7
+DEFAULT_DAYS = 3  # 表单默认天数
+K = 5
+REPEAT = 300
+CONDITIONS = ["晴", "多云", "小雨", "中雨", "阴", "晴", "多云"]
+
+
+def poi_set_overlaps(alternatives):
+    """两两方案所用地点集合的 Jaccard 重合度"""
+    sets = [{poi_id for day in alt["days"] for poi_id in day["depends_on"]["poi_ids"]} for alt in alternatives]
+    return [len(a & b) / len(a | b) for a, b in itertools.combinations(sets, 2) if a | b]
+
+
+def bench_alternatives():
+    snapshot = build_snapshot(str(BASE_DIR / "processed_data"), 1)
+    start_date = datetime.now(planner.TIMEZONE)
+    weather = {
+        "status": "success",
+        "location": "韶关",
+        "forecast": [
+            {
+                "date": (start_date + timedelta(days=i)).strftime("%Y-%m-%d"),
+                "condition": condition,
+                "temp_max": "26",
+                "temp_min": "18"
+            }
+            for i, condition in enumerate(CONDITIONS[:DAYS])
+        ]
+    }
+    pois = planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture)
+
+    def plan(k, rebuild):
+        candidates = planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture) if rebuild else pois
+        return planner.generate_alternatives(DAYS, "历史人文", weather, candidates, k=k, start_date=start_date)
+
+    print("=" * 40)
+    print(f"行程天数: {DAYS}，地点数: {len(pois)}，生成方案数: {K}")
+    for days in (DEFAULT_DAYS, DAYS):
+        alternatives = planner.generate_alternatives(days, "历史人文", weather, pois, k=K, start_date=start_date)
+        overlaps = poi_set_overlaps(alternatives)
+        print(f"{days} 天方案间地点集合重合度: 平均 {sum(overlaps) / max(len(overlaps), 1):.0%}，"
+              f"最高 {max(overlaps, default=0):.0%}（{len(alternatives)} 个方案）")
+    for rebuild, label in ((False, "仅规划"), (True, "含数据准备")):
+        single = timeit.timeit(lambda: plan(1, rebuild), number=REPEAT) / REPEAT
+        top_k = timeit.timeit(lambda: plan(K, rebuild), number=REPEAT) / REPEAT
+        print(f"[{label}] 单个方案: {single * 1e3:.2f} ms，{K} 个方案: {top_k * 1e3:.2f} ms，"
+              f"为单个方案的 {top_k / single:.2f} 倍")
+    print("=" * 40)
+
+
+if __name__ == "__main__":
+    bench_alternatives()
@@ -0,0 +1,65 @@
+﻿"""
+增量重规划与完整重规划的耗时对比
+场景：7 天行程，新天气预报中只有 1 天的天气分支发生变化
+"""
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+import planner  # noqa: E402
+from catalog import build_snapshot  # noqa: E402
+
+DAYS = 7
+REPEAT = 2000
+
+
+def make_weather(start_date, conditions):
+    """构造与 get_amap_weather 返回格式一致的天气数据"""
+    return {
+        "status": "success",
+        "location": "韶关",
+        "report_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "forecast": [
+            {
+                "date": (start_date + timedelta(days=i)).strftime("%Y-%m-%d"),
+                "condition": condition,
+                "temp_max": "26",
+                "temp_min": "18"
+            }
+            for i, condition in enumerate(conditions)
+        ]
+    }
+
+
+def bench_replan():
+    snapshot = build_snapshot(str(BASE_DIR / "processed_data"), 1)
+    pois = planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture)
+    start_date = datetime.now(planner.TIMEZONE)
+    old_weather = make_weather(start_date, ["晴", "多云", "小雨", "晴", "阴", "晴", "多云"])
+    new_weather = make_weather(start_date, ["晴", "多云", "小雨", "中雨", "阴", "晴", "多云"])
+
+    itinerary = planner.generate_itinerary(DAYS, "历史人文", old_weather, pois, start_date)
+    _, replanned = planner.replan_itinerary(itinerary, new_weather, pois)
+
+    full = timeit.timeit(
+        lambda: planner.generate_itinerary(DAYS, "历史人文", new_weather, pois, start_date), number=REPEAT
+    ) / REPEAT
+    incremental = timeit.timeit(
+        lambda: planner.replan_itinerary(itinerary, new_weather, pois), number=REPEAT
+    ) / REPEAT
+
+    print("=" * 40)
+    print(f"行程天数: {DAYS}，天气分支变化: {len(replanned)} 天 ({'、'.join(replanned)})")
+    print(f"完整重规划: {full * 1e6:.1f} µs/次")
+    print(f"增量重规划: {incremental * 1e6:.1f} µs/次")
+    print(f"加速比: {full / incremental:.2f}x")
+    print("=" * 40)
+
+
+if __name__ == "__main__":
+    bench_replan()
@@ -0,0 +1,181 @@
+﻿"""
+页面交互开销测量：启动真实的 Streamlit 服务，通过 websocket 模拟浏览器点击
+- 服务端 CPU：读取服务进程 /proc/<pid>/stat 的 utime+stime，取每次交互前后的差值
+- 墙钟时间：从发送重跑请求到收到 script_finished 的耗时
+- 片段内的控件按浏览器的方式带上 fragment_id，只重跑对应片段
+
+用法：python scripts/bench_reruns.py [app.py] [--repeat 20] [--port 8599]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.httpclient import HTTPClientError
+from tornado.websocket import websocket_connect
+
+BASE_DIR = Path(__file__).parent.parent
+
+# 测量的交互：(名称, 控件标签, 操作)
+INTERACTIONS = [
+    ("切换提示词预览", "显示提示词预览", "toggle"),
+    ("验证API密钥", "验证API密钥", "click"),
+    ("检查DeepSeek状态", "检查DeepSeek状态", "click"),
+    ("切换备选方案", "备选方案", "cycle"),
+    ("一键生成攻略", "一键生成攻略", "click"),
+]
+WIDGET_TYPES = ("button", "checkbox", "radio", "slider", "selectbox", "text_input")
+FORM_SUBMIT = "一键生成攻略"
+
+
+def process_cpu(pid):
+    """进程累计 CPU 时间（秒）"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class BrowserSession:
+    """最小的 Streamlit 前端：记录控件 id 和所属片段，按标签触发控件"""
+
+    def __init__(self, url):
+        self.url = url
+        self.conn = None
+        self.widgets = {}  # 标签 → (控件类型, 控件 id, 片段 id, 元素)
+        self.values = {}   # 控件 id → 非默认值的 WidgetState
+
+    async def connect(self):
+        self.conn = await websocket_connect(self.url, max_message_size=64 * 1024 * 1024)
+        # 与浏览器一样立即发送小包，避免 Nagle 算法带来的约 40ms 延迟
+        self.conn.stream.set_nodelay(True)
+
+    async def rerun(self, trigger=None, fragment_id=""):
+        """发送重跑请求并等待脚本运行结束，返回墙钟耗时"""
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.fragment_id = fragment_id
+        for widget_state in self.values.values():
+            state.widget_states.widgets.add().CopyFrom(widget_state)
+        if trigger is not None:
+            state.widget_states.widgets.add().CopyFrom(trigger)
+
+        start = time.perf_counter()
+        await self.conn.write_message(msg.SerializeToString(), binary=True)
+        while True:
+            raw = await self.conn.read_message()
+            if raw is None:
+                raise ConnectionError("websocket 已断开")
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof("type")
+            if kind == "delta":
+                self._collect(forward.delta)
+            elif kind == "script_finished":
+                # st.rerun() 中断的运行之后还有一次完整运行
+                if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return time.perf_counter() - start
+
+    def _collect(self, delta):
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind in WIDGET_TYPES:
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = (kind, widget.id, delta.fragment_id, widget)
+
+    async def interact(self, label, action):
+        """按标签操作控件，返回 (墙钟耗时, 是否为片段重跑)"""
+        kind, widget_id, fragment_id, widget = self.widgets[label]
+        trigger = None
+        if action == "click":
+            trigger = WidgetState(id=widget_id, trigger_value=True)
+        elif action == "toggle":
+            current = self.values.get(widget_id)
+            value = not (current.bool_value if current is not None else widget.default)
+            self.values[widget_id] = WidgetState(id=widget_id, bool_value=value)
+        elif action == "cycle":
+            current = self.values.get(widget_id)
+            index = (current.int_value if current is not None else widget.default) + 1
+            self.values[widget_id] = WidgetState(id=widget_id, int_value=index % len(widget.options))
+        return await self.rerun(trigger, fragment_id), bool(fragment_id)
+
+
+def start_server(app, port):
+    cmd = [
+        sys.executable, "-m", "streamlit", "run", str(app),
+        "--server.headless", "true", "--server.port", str(port),
+        "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none",
+    ]
+    env = dict(os.environ, PYTHONPATH=str(BASE_DIR))
+    return subprocess.Popen(cmd, cwd=str(BASE_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for_server(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await websocket_connect(url)
+        except (ConnectionError, HTTPClientError, OSError):
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def measure(app, port, repeat):
+    server = start_server(app, port)
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    try:
+        (await wait_for_server(url)).close()
+        session = BrowserSession(url)
+        await session.connect()
+
+        # 首次加载并生成一次行程，让行程区出现
+        first = await session.rerun()
+        await session.interact(FORM_SUBMIT, "click")
+        await session.rerun()
+        # 预热：每种交互先执行一次（加载缓存、构建索引）
+        for _, label, action in INTERACTIONS:
+            await session.interact(label, action)
+
+        results = []
+        for name, label, action in INTERACTIONS:
+            walls = []
+            cpu_before = process_cpu(server.pid)
+            for _ in range(repeat):
+                wall, fragment = await session.interact(label, action)
+                walls.append(wall)
+            cpu = (process_cpu(server.pid) - cpu_before) / repeat
+            results.append((name, fragment, cpu, sum(walls) / len(walls)))
+        return first, results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("app", nargs="?", default=str(BASE_DIR / "main.py"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8599)
+    args = parser.parse_args()
+
+    first, results = asyncio.run(measure(args.app, args.port, args.repeat))
+    print("=" * 60)
+    print(f"应用: {args.app}（每种交互重复 {args.repeat} 次）")
+    print(f"首次加载: {first * 1e3:.1f} ms")
+    for name, fragment, cpu, wall in results:
+        scope = "片段" if fragment else "整页"
+        print(f"{name:<12}[{scope}] 服务端CPU: {cpu * 1e3:7.1f} ms/次，墙钟: {wall * 1e3:7.1f} ms/次")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+﻿"""
+多进程内存占用测量：对比每个 worker 进程自行加载数据和挂载共享镜像两种方式
+- 启动 N 个独立的 worker 进程（spawn，与多个服务进程一样互不共享 Python 堆）
+- 每个进程按模式准备数据目录、地点解析器、气候表和规划用地点表，并执行一组查询
+  （精确 / 补全 / 模糊解析、全年气候查询、生成备选行程），让用到的页面都被实际访问
+  - private：每个进程读取 CSV 创建 DataFrame，自行构建全部索引（共享镜像不可用时的应用行为）
+  - shared：挂载镜像，只有发布镜像的第一个进程读取 CSV，其余进程不创建 DataFrame
+- 全部进程就绪后同时读取 /proc/<pid>/smaps_rollup：RSS、PSS（共享页按进程数均摊）、私有内存
+- base 模式只导入相同的模块，作为对照
+
+用法：python scripts/bench_shared_catalog.py [--workers 1 8 32] [--modes base private shared]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+import planner  # noqa: E402
+from catalog import build_snapshot, file_signature  # noqa: E402
+from climatology import load_climatology  # noqa: E402
+from location_resolver import load_resolver  # noqa: E402
+from shared_catalog import SharedCatalogHost, attach_catalog, attach_reference  # noqa: E402
+
+DATA_DIR = BASE_DIR / "processed_data"
+QUERIES = ["韶关", "shaoguan", "韶官", "shoaguan", "lechan", "仁花县", "广东韶关仁化", "南熊", "ry", "湖南长沙"]
+THEMES = ["自然风光", "历史人文", "美食之旅"]
+MODES = ("base", "private", "shared")
+
+
+def memory_usage():
+    """本进程的 (RSS, PSS, 私有内存)，单位 KB"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return values["Rss"], values["Pss"], values["Private_Clean"] + values["Private_Dirty"]
+
+
+def exercise(resolver, climatology, pois):
+    """执行一组查询，访问解析索引、气候表和地点表"""
+    from datetime import date, timedelta
+    for query in QUERIES:
+        resolver.resolve(query)
+        resolver.complete(query)
+        resolver.fuzzy(query)
+    start = date(2024, 1, 1)
+    for i in range(366):
+        climatology.lookup("440203", start + timedelta(days=i))
+    weather = climatology.fill_forecast({"forecast": []}, "440200", 5, start)
+    for theme in THEMES:
+        planner.generate_alternatives(5, theme, weather, pois, k=3, start_date=start)
+
+
+def worker(mode, image_dir, results, barrier):
+    held = None
+    if mode == "private":
+        snapshot = build_snapshot(str(DATA_DIR), 1)
+        held = (load_resolver(), load_climatology(),
+                planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture), snapshot)
+    elif mode == "shared":
+        host = SharedCatalogHost(image_dir)
+        resolver, climatology = attach_reference(host)
+        catalog = attach_catalog(
+            host, str(DATA_DIR), file_signature(str(DATA_DIR)),
+            lambda snapshot: planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture)
+        )
+        held = (resolver, climatology, catalog.pois)
+    if held is not None:
+        exercise(*held[:3])
+    results.put(memory_usage())
+    # 所有进程都完成测量后再退出，保证共享页面在测量期间被全部进程同时映射
+    barrier.wait()
+
+
+def measure(mode, workers, image_dir):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    barrier = context.Barrier(workers + 1)
+    processes = [context.Process(target=worker, args=(mode, image_dir, results, barrier)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in range(workers)]
+    barrier.wait()
+    for process in processes:
+        process.join()
+    return [sum(values) / workers for values in zip(*samples)], sum(sample[1] for sample in samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    # 使用独立的镜像目录，不影响正在运行的应用
+    image_dir = tempfile.mkdtemp(prefix="bench-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    try:
+        print("=" * 72)
+        print(f"{'模式':<8}{'进程数':>6}{'RSS/进程':>12}{'PSS/进程':>12}{'私有/进程':>12}{'PSS合计':>12}")
+        for workers in args.workers:
+            for mode in args.modes:
+                (rss, pss, private), total = measure(mode, workers, image_dir)
+                print(f"{mode:<8}{workers:>8}{rss / 1024:>11.1f}M{pss / 1024:>11.1f}M"
+                      f"{private / 1024:>11.1f}M{total / 1024:>11.1f}M")
+        print("=" * 72)
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+﻿"""
+行政区划表生成脚本（离线地点解析使用）
+输入：adcode,name 格式的全国行政区划 CSV（如 cpca 包自带的 resources/adcodes.csv，MIT 许可）
+输出：processed_data/adcodes.csv，字段：adcode,name,short_name,pinyin,initials,level
+依赖：pypinyin（仅生成时需要，应用运行时不需要）
+
+用法：python scripts/build_adcodes.py <adcodes.csv> [56_nations.csv]
+"""
+
+import csv
+import re
+import sys
+from pathlib import Path
+
+from pypinyin import lazy_pinyin
+
+# ====================== 配置区 ======================
+BASE_DIR = Path(__file__).parent.parent
+OUTPUT_PATH = BASE_DIR / "processed_data" / "adcodes.csv"
+# ===================================================
+
+# 非实际地名的占位条目
+PLACEHOLDER_NAMES = {"市辖区", "县", "省直辖县级行政区划", "自治区直辖县级行政区划"}
+
+# pypinyin 读错的多音字地名
+PINYIN_OVERRIDES = {
+    "朝阳": ["chao", "yang"],
+    "单县": ["shan", "xian"],
+}
+
+# 通用后缀（按长度从长到短匹配，去掉后仍至少保留两个字）
+GENERIC_SUFFIXES = sorted(
+    ["特别行政区", "自治区", "地区", "林区", "省", "市", "盟", "县", "区", "旗"],
+    key=len, reverse=True
+)
+
+
+def load_nations(path):
+    """读取民族名称（用于去掉"瑶族自治县"等后缀）"""
+    if path is None:
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def short_name(name, nation_pattern):
+    """去掉行政级别后缀得到简称（如"乳源瑶族自治县" → "乳源"，"韶关市" → "韶关"）"""
+    if nation_pattern is not None:
+        stripped = nation_pattern.sub("", name)
+        if stripped != name and len(stripped) >= 2:
+            return stripped
+    for suffix in GENERIC_SUFFIXES:
+        if name.endswith(suffix) and len(name) - len(suffix) >= 2:
+            return name[:-len(suffix)]
+    return name
+
+
+def level_of(adcode):
+    """1=省级，2=地级，3=县级"""
+    if adcode.endswith("0000"):
+        return 1
+    if adcode.endswith("00"):
+        return 2
+    return 3
+
+
+def build_adcodes(source_path, nations_path=None):
+    nations = load_nations(nations_path)
+    nation_pattern = None
+    if nations:
+        alternatives = "|".join(sorted((re.escape(n) for n in nations), key=len, reverse=True))
+        nation_pattern = re.compile(rf"(?:{alternatives})+自治(?:区|州|县|旗)$")
+
+    rows = {}
+    with open(source_path, encoding="utf-8-sig") as f:
+        for record in csv.DictReader(f):
+            name = record["name"].strip()
+            adcode = record["adcode"].strip()[:6]
+            if not name or name in PLACEHOLDER_NAMES or len(adcode) != 6:
+                continue
+            short = short_name(name, nation_pattern)
+            syllables = PINYIN_OVERRIDES.get(short) or lazy_pinyin(short)
+            rows[adcode] = {
+                "adcode": adcode,
+                "name": name,
+                "short_name": short,
+                "pinyin": "".join(syllables),
+                "initials": "".join(s[0] for s in syllables),
+                "level": level_of(adcode),
+            }
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_PATH, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["adcode", "name", "short_name", "pinyin", "initials", "level"])
+        writer.writeheader()
+        for adcode in sorted(rows):
+            writer.writerow(rows[adcode])
+
+    print(f"✅ 行政区划表生成完成，共 {len(rows)} 条：{OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    build_adcodes(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,93 @@
+﻿"""
+历史同期气候表生成脚本（天气预报范围外的日期使用）
+输入：各城市的月气候平均值（最高 / 最低气温、降水日数，见 MONTHLY_NORMALS）
+输出：processed_data/climatology.csv，字段：adcode,day_of_year,rain_prob,temp_min,temp_max
+- 以每月 15 日为锚点，对 366 天做首尾相接的线性插值
+- 降雨概率 = 月降水日数（日降水量 ≥ 0.1mm）/ 当月天数
+
+月平均值为中国气象局地面气象站 1991–2020 年整编资料的近似值，
+有逐日整编资料时可直接替换 MONTHLY_NORMALS 后重新生成。
+
+用法：python scripts/build_climatology.py
+"""
+
+import calendar
+import csv
+from datetime import date
+from pathlib import Path
+
+# ====================== 配置区 ======================
+BASE_DIR = Path(__file__).parent.parent
+OUTPUT_PATH = BASE_DIR / "processed_data" / "climatology.csv"
+# ===================================================
+
+# adcode → 1~12 月的 (平均最高气温, 平均最低气温, 降水日数)
+MONTHLY_NORMALS = {
+    # 韶关
+    "440200": [
+        (15.1, 7.3, 10.6), (17.0, 9.8, 14.0), (20.3, 13.3, 18.6), (25.6, 18.1, 18.4),
+        (29.5, 21.9, 19.2), (31.6, 24.3, 19.4), (33.7, 25.0, 14.4), (33.2, 24.7, 15.6),
+        (31.6, 22.9, 10.3), (28.3, 18.6, 6.0), (23.4, 13.4, 6.3), (18.0, 8.7, 6.6),
+    ],
+    # 广州
+    "440100": [
+        (18.7, 10.6, 7.0), (19.9, 12.6, 10.3), (22.5, 15.8, 14.6), (26.6, 19.9, 15.9),
+        (30.1, 23.2, 17.8), (32.1, 25.1, 19.7), (33.6, 25.8, 17.1), (33.5, 25.7, 17.5),
+        (32.2, 24.3, 12.8), (29.6, 21.1, 5.8), (25.3, 16.4, 5.4), (20.6, 11.8, 5.5),
+    ],
+    # 深圳
+    "440300": [
+        (19.8, 12.2, 6.6), (20.5, 13.8, 8.4), (22.7, 16.5, 10.8), (26.2, 20.4, 12.3),
+        (29.5, 23.6, 15.4), (31.2, 25.5, 19.5), (32.2, 25.9, 18.3), (32.1, 25.7, 18.5),
+        (31.2, 24.8, 14.5), (29.2, 22.0, 7.2), (25.6, 17.8, 5.4), (21.5, 13.4, 4.6),
+    ],
+}
+
+LEAP_YEAR = 2000  # 按闰年生成 366 天
+
+
+def monthly_anchors(normals):
+    """每月 15 日在一年中的位置及当月的 (最高气温, 最低气温, 降雨概率)"""
+    anchors = []
+    for month, (temp_max, temp_min, rain_days) in enumerate(normals, start=1):
+        position = date(LEAP_YEAR, month, 15).timetuple().tm_yday - 1
+        rain_prob = rain_days / calendar.monthrange(LEAP_YEAR, month)[1]
+        anchors.append((position, (temp_max, temp_min, rain_prob)))
+    return anchors
+
+
+def interpolate(anchors, index, period=366):
+    """首尾相接的线性插值（12 月与次年 1 月之间也平滑过渡）"""
+    for (pos_a, values_a), (pos_b, values_b) in zip(anchors, anchors[1:] + [(anchors[0][0] + period, anchors[0][1])]):
+        shifted = index if index >= anchors[0][0] else index + period
+        if pos_a <= shifted <= pos_b:
+            weight = (shifted - pos_a) / (pos_b - pos_a)
+            return tuple(a + (b - a) * weight for a, b in zip(values_a, values_b))
+    raise ValueError(f"无法插值: {index}")
+
+
+def build_climatology():
+    rows = []
+    for adcode, normals in sorted(MONTHLY_NORMALS.items()):
+        anchors = monthly_anchors(normals)
+        for index in range(366):
+            temp_max, temp_min, rain_prob = interpolate(anchors, index)
+            rows.append({
+                "adcode": adcode,
+                "day_of_year": index + 1,
+                "rain_prob": f"{rain_prob:.2f}",
+                "temp_min": f"{temp_min:.1f}",
+                "temp_max": f"{temp_max:.1f}",
+            })
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_PATH, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["adcode", "day_of_year", "rain_prob", "temp_min", "temp_max"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"✅ 气候表生成完成，共 {len(MONTHLY_NORMALS)} 个城市、{len(rows)} 条：{OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    build_climatology()
@@ -0,0 +1,320 @@
+﻿"""
+韶关旅游数据去重（实体合并）脚本
+流程位置：generate_ids.py 之后、validate_data.py 之前
+规则：
+  1. 名称归一化（全半角、括号内分店信息、标点、该类型的通用后缀）
+  2. 分块键：[子类 + 名称前缀]、[区域 + 名称前缀]，只在块内两两比较；
+     子类缺失的记录（多平台导出中很常见）同时放入同前缀的每个子类块
+  3. 块内相似度打分（字符二元组 Jaccard / 编辑相似度；包含关系须同区域或长度相近才算高分），超过阈值即合并
+     子类不同、或括号内分店信息不同（如"（风度路店）"与"（东堤店）"）的记录不合并
+  4. 每组保留信息最完整的记录及其原唯一编码，其余编码写入"合并编码"列
+输出：覆盖 processed_data/*_with_id.csv，并生成 processed_data/merge_report.csv
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import pandas as pd
+
+# ====================== 配置区 ======================
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "processed_data"
+REPORT_PATH = DATA_DIR / "merge_report.csv"
+# ===================================================
+
+ENCODING = "utf-8-sig"  # 处理含 BOM 头的 UTF-8 文件
+
+# 各类型的字段配置
+DEDUP_CONFIG = {
+    "attractions": {
+        "file": "attractions_with_id.csv",
+        "name_field": "名称",
+        "subtype_field": "主类型",
+        "area_fields": ["区域", "地址"],
+        "suffixes": ["风景名胜区", "旅游景区", "风景区", "旅游区", "景区"],
+    },
+    "food": {
+        "file": "food_with_id.csv",
+        "name_field": "店名",
+        "subtype_field": "类型",
+        "area_fields": ["区域", "地址"],
+        "suffixes": ["餐厅", "饭店", "酒家", "酒楼", "餐馆", "餐室", "美食", "馆"],
+    },
+    "culture": {
+        "file": "culture_with_id.csv",
+        "name_field": "名称",
+        "subtype_field": "类别",
+        "area_fields": ["传承地"],
+        # 非遗项目名称中的"制作技艺""技艺"区分不同项目（如长鼓舞与长鼓舞制作技艺），不作为通用后缀
+        "suffixes": [],
+    },
+}
+
+SIMILARITY_THRESHOLD = 0.85  # 判定为同一实体的最低相似度
+PREFIX_LENGTH = 2            # 分块使用的名称前缀长度
+MAX_BLOCK_SIZE = 100         # 超大块改用排序邻域窗口，避免平方级比较
+WINDOW_SIZE = 20             # 排序邻域窗口大小
+CONTAINMENT_SCORE = 0.9     # 名称包含关系（同区域或长度相近时）的相似度
+CONTAINMENT_MIN_RATIO = 0.75 # 不同区域时，包含关系要求短名称至少占长名称的比例
+MERGE_FIELD = "合并编码"
+
+BRANCH_PATTERN = re.compile(r"[(（【\[].*?[)）】\]]")  # 括号内的分店、备注信息
+PUNCT_PATTERN = re.compile(r"[\s·•.,，、\-—_/|'\"“”‘’]+")
+AREA_PATTERN = re.compile(r"(.{2,3}?(?:自治县|县|区|市))")
+
+
+def normalize_name(name, suffixes=()):
+    """名称归一化：全角转半角、去括号内容、去标点和通用后缀（按长度从长到短匹配）、小写"""
+    if pd.isna(name):
+        return ""
+    text = unicodedata.normalize("NFKC", str(name)).lower()
+    text = BRANCH_PATTERN.sub("", text)
+    text = PUNCT_PATTERN.sub("", text)
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if text.endswith(suffix) and len(text) > len(suffix) + 1:
+            text = text[:-len(suffix)]
+            break
+    return text
+
+
+def branch_text(name):
+    """括号内的分店、备注信息（归一化后拼接），没有时为空字符串"""
+    if pd.isna(name):
+        return ""
+    text = unicodedata.normalize("NFKC", str(name)).lower()
+    return "".join(PUNCT_PATTERN.sub("", part[1:-1]) for part in BRANCH_PATTERN.findall(text))
+
+
+def normalize_area(value):
+    """提取区县级地名作为区域分块键（如"仁化县石塘镇" → "仁化县"）"""
+    if pd.isna(value):
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).strip()
+    match = AREA_PATTERN.search(text)
+    return match.group(1) if match else text[:3]
+
+
+def bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def similarity(a, b, grams_a=None, grams_b=None, same_area=False):
+    """两个归一化名称的相似度（0~1）；可传入预先计算的二元组集合
+
+    一方完整包含另一方（如"丹霞山"与"丹霞山世界地质公园"）本身不足以判定为同一实体
+    （"丹霞山"与"丹霞山温泉"），还需要位于同一区域，或短名称占长名称的大部分。
+    """
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+
+    shorter, longer = (a, b) if len(a) <= len(b) else (b, a)
+    if len(shorter) >= 3 and shorter in longer and (same_area or len(shorter) / len(longer) >= CONTAINMENT_MIN_RATIO):
+        return CONTAINMENT_SCORE
+
+    # 先用二元组 Jaccard 快速排除，再计算编辑相似度
+    set_a = grams_a if grams_a is not None else bigrams(a)
+    set_b = grams_b if grams_b is not None else bigrams(b)
+    jaccard = len(set_a & set_b) / len(set_a | set_b)
+    if jaccard < 0.3:
+        return jaccard
+    return max(jaccard, SequenceMatcher(None, a, b).ratio())
+
+
+class UnionFind:
+    """并查集，记录合并关系"""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def candidate_pairs(block):
+    """块内候选对：小块两两比较，大块按名称排序后只比较窗口内的邻居"""
+    if len(block) <= MAX_BLOCK_SIZE:
+        for i in range(len(block)):
+            for j in range(i + 1, len(block)):
+                yield block[i], block[j]
+    else:
+        for i in range(len(block)):
+            for j in range(i + 1, min(i + WINDOW_SIZE, len(block))):
+                yield block[i], block[j]
+
+
+def find_duplicates(names, subtypes, areas, branches=None):
+    """返回 (并查集, {(i, j): 相似度})；names 为归一化后的名称，branches 为括号内的分店信息"""
+    branches = branches or [""] * len(names)
+    prefix_subtypes = defaultdict(set)
+    for idx, name in enumerate(names):
+        if name:
+            prefix_subtypes[name[:PREFIX_LENGTH]].add(subtypes[idx])
+
+    blocks = defaultdict(list)
+    for idx, name in enumerate(names):
+        if not name:
+            continue
+        prefix = name[:PREFIX_LENGTH]
+        # 子类缺失的记录与同前缀各子类的记录都要比较，是否冲突由 conflicts() 判断
+        for subtype in (subtypes[idx],) if subtypes[idx] else prefix_subtypes[prefix]:
+            blocks[("subtype", subtype, prefix)].append(idx)
+        if areas[idx]:
+            blocks[("area", areas[idx], prefix)].append(idx)
+
+    grams = [bigrams(name) if name else set() for name in names]
+    uf = UnionFind(len(names))
+    scores = {}
+    # 每组已确定的 (子类, 分店)；没有分店的记录不能把两个不同分店连成一组
+    labels = [(subtypes[i], branches[i]) for i in range(len(names))]
+
+    def conflicts(i, j):
+        return any(a and b and a != b for a, b in zip(labels[uf.find(i)], labels[uf.find(j)]))
+
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        block.sort(key=lambda i: names[i])
+        for i, j in candidate_pairs(block):
+            pair = (min(i, j), max(i, j))
+            if pair in scores:
+                continue
+            # 子类不同（如传统舞蹈与传统技艺）或分店不同的记录不是同一实体
+            if conflicts(i, j):
+                continue
+            same_area = bool(areas[i]) and areas[i] == areas[j]
+            score = similarity(names[i], names[j], grams[i], grams[j], same_area)
+            if score >= SIMILARITY_THRESHOLD:
+                merged = tuple(a or b for a, b in zip(labels[uf.find(i)], labels[uf.find(j)]))
+                scores[pair] = score
+                uf.union(i, j)
+                labels[uf.find(i)] = merged
+    return uf, scores
+
+
+def dedup_frame(df, data_type):
+    """对单张表去重，返回 (去重后的表, 合并报告行列表)"""
+    config = DEDUP_CONFIG[data_type]
+    df = df.reset_index(drop=True)
+
+    names = [normalize_name(v, config["suffixes"]) for v in df[config["name_field"]]]
+    branches = [branch_text(v) for v in df[config["name_field"]]]
+    subtypes = [
+        "" if pd.isna(v) else str(v).split("/")[0].strip()
+        for v in df.get(config["subtype_field"], pd.Series([""] * len(df)))
+    ]
+    area_field = next((f for f in config["area_fields"] if f in df.columns), None)
+    areas = [normalize_area(v) for v in df[area_field]] if area_field else [""] * len(df)
+
+    uf, scores = find_duplicates(names, subtypes, areas, branches)
+
+    groups = defaultdict(list)
+    for idx in range(len(df)):
+        groups[uf.find(idx)].append(idx)
+
+    # 信息完整度：非空字段数，相同则保留较早的记录
+    completeness = df.notna().sum(axis=1) - (df.astype(str) == "").sum(axis=1)
+
+    fill_columns = df.columns.drop(MERGE_FIELD, errors="ignore")
+    keep_rows = []
+    report = []
+    merged_ids = {}
+    for members in groups.values():
+        canonical = max(members, key=lambda i: (completeness[i], -i))
+        keep_rows.append(canonical)
+        others = [i for i in members if i != canonical]
+        if not others:
+            continue
+
+        # 用重复记录补全保留记录的空字段
+        for column in fill_columns:
+            if pd.isna(df.at[canonical, column]) or df.at[canonical, column] == "":
+                for other in others:
+                    value = df.at[other, column]
+                    if not pd.isna(value) and value != "":
+                        df.at[canonical, column] = value
+                        break
+
+        # 被合并记录的编码及其此前已合并的编码
+        merged = []
+        for i in others:
+            merged.append(str(df.at[i, "唯一编码"]))
+            if MERGE_FIELD in df.columns and not pd.isna(df.at[i, MERGE_FIELD]) and df.at[i, MERGE_FIELD]:
+                merged.append(str(df.at[i, MERGE_FIELD]))
+        merged_ids[canonical] = "、".join(merged)
+        for other in others:
+            pair = (min(canonical, other), max(canonical, other))
+            report.append({
+                "数据类型": data_type,
+                "保留编码": df.at[canonical, "唯一编码"],
+                "保留名称": df.at[canonical, config["name_field"]],
+                "合并编码": df.at[other, "唯一编码"],
+                "合并名称": df.at[other, config["name_field"]],
+                "相似度": round(scores.get(pair, similarity(names[canonical], names[other],
+                                                            same_area=bool(areas[canonical]) and areas[canonical] == areas[other])), 3),
+            })
+
+    result = df.loc[sorted(keep_rows)].copy()
+    # 保留上一次去重已记录的合并编码
+    previous = result[MERGE_FIELD].fillna("") if MERGE_FIELD in result.columns else pd.Series("", index=result.index)
+    current = pd.Series(merged_ids, dtype=object).reindex(result.index).fillna("")
+    result[MERGE_FIELD] = [
+        "、".join(part for part in (p, c) if part) for p, c in zip(previous, current)
+    ]
+    return result, report
+
+
+def process_data(data_type):
+    """处理指定类型数据，返回合并报告行"""
+    config = DEDUP_CONFIG[data_type]
+    path = DATA_DIR / config["file"]
+
+    if not path.exists():
+        print(f"⛔ 文件 {path} 未找到，请先执行 generate_ids.py")
+        return []
+
+    try:
+        df = pd.read_csv(path, encoding=ENCODING)
+
+        missing_fields = [f for f in (config["name_field"], "唯一编码") if f not in df.columns]
+        if missing_fields:
+            print(f"⛔ {data_type} 数据缺失必要字段: {', '.join(missing_fields)}")
+            return []
+
+        result, report = dedup_frame(df, data_type)
+        result.to_csv(path, index=False, encoding=ENCODING)
+        print(f"✅ {data_type} 去重完成：{len(df)} → {len(result)} 条（合并 {len(df) - len(result)} 条）")
+        return report
+
+    except Exception as e:
+        print(f"❌ {data_type} 去重失败：{str(e)}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+
+if __name__ == "__main__":
+    print("=" * 40)
+    print("开始去重旅游数据...")
+
+    all_reports = []
+    for data_type in DEDUP_CONFIG:
+        all_reports.extend(process_data(data_type))
+
+    report_columns = ["数据类型", "保留编码", "保留名称", "合并编码", "合并名称", "相似度"]
+    pd.DataFrame(all_reports, columns=report_columns).to_csv(REPORT_PATH, index=False, encoding=ENCODING)
+
+    print("=" * 40)
+    print(f"去重完成！共合并 {len(all_reports)} 条重复记录，报告: {REPORT_PATH}")
@@ -0,0 +1,155 @@
+﻿"""
+本地模拟高德天气API服务
+- 按密钥模拟 QPS 限制（infocode 10004）与每日配额（infocode 10003）
+- 未登记的密钥返回 INVALID_USER_KEY（infocode 10001）
+- 可配置响应延迟，用于在本地验证密钥轮换、限流与熔断
+
+用法：python scripts/fake_amap_server.py --keys KEY1,KEY2 --qps 3 --daily-limit 100
+然后在 secrets.toml 中设置 AMAP_BASE_URL = "http://127.0.0.1:8765"
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CONDITIONS = ["晴", "多云", "阴", "小雨", "中雨", "雷阵雨"]
+
+
+def build_casts(city, days=4):
+    """生成从今天起 days 天的预报数据（与高德 extensions=all 格式一致）
+    同一城市、同一天的预报固定不变（与真实接口一样，同一天内重复查询得到相同结果）"""
+    today = datetime.now()
+    casts = []
+    for i in range(days):
+        day = today + timedelta(days=i)
+        rng = random.Random(f"{city}:{day:%Y-%m-%d}")
+        low = rng.randint(10, 22)
+        casts.append({
+            "date": day.strftime("%Y-%m-%d"),
+            "week": str(day.isoweekday()),
+            "dayweather": rng.choice(CONDITIONS),
+            "nightweather": rng.choice(CONDITIONS),
+            "daytemp": str(low + rng.randint(4, 10)),
+            "nighttemp": str(low),
+        })
+    return casts
+
+
+class FakeAmapState:
+    """按密钥记录调用次数与最近一秒内的请求时间"""
+
+    def __init__(self, keys, qps, daily_limit, latency):
+        self.keys = set(keys)
+        self.qps = qps
+        self.daily_limit = daily_limit
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.recent = defaultdict(deque)
+        self.daily_used = defaultdict(int)
+        self.total = defaultdict(int)
+
+    def check(self, key):
+        """返回 (infocode, info)"""
+        with self.lock:
+            self.total[key] += 1
+            if key not in self.keys:
+                return "10001", "INVALID_USER_KEY"
+
+            now = time.monotonic()
+            window = self.recent[key]
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) >= self.qps:
+                return "10004", "ACCESS_TOO_FREQUENT"
+            if self.daily_used[key] >= self.daily_limit:
+                return "10003", "DAILY_QUERY_OVER_LIMIT"
+
+            window.append(now)
+            self.daily_used[key] += 1
+            return "10000", "OK"
+
+
+def make_handler(state):
+    class FakeAmapHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+            if state.latency:
+                time.sleep(state.latency)
+
+            if url.path == "/stats":
+                self._send({"daily_used": dict(state.daily_used), "total": dict(state.total)})
+                return
+            if url.path != "/v3/weather/weatherInfo":
+                self.send_error(404)
+                return
+
+            infocode, info = state.check(params.get("key", ""))
+            if infocode != "10000":
+                self._send({"status": "0", "info": info, "infocode": infocode})
+                return
+
+            city = params.get("city", "")
+            if not city:
+                self._send({"status": "0", "info": "INVALID_PARAMS", "infocode": "20000"})
+                return
+
+            self._send({
+                "status": "1",
+                "count": "1",
+                "info": "OK",
+                "infocode": "10000",
+                "forecasts": [{
+                    "city": city,
+                    "adcode": "440200",
+                    "province": "广东",
+                    "reporttime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "casts": build_casts(city),
+                }],
+            })
+
+        def _send(self, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeAmapHandler
+
+
+def start_server(keys, qps=3, daily_limit=5000, latency=0.0, host="127.0.0.1", port=8765):
+    """在后台线程中启动模拟服务，返回 (server, state)"""
+    state = FakeAmapState(keys, qps, daily_limit, latency)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟高德天气API")
+    parser.add_argument("--keys", default="0" * 32, help="允许的密钥，逗号分隔")
+    parser.add_argument("--qps", type=int, default=3)
+    parser.add_argument("--daily-limit", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0, help="响应延迟（秒）")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server, _ = start_server(args.keys.split(","), args.qps, args.daily_limit, args.latency, port=args.port)
+    print(f"✅ 模拟高德API已启动: http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,437 @@
+﻿"""
+流量回放压测：估算单机能同时服务多少个行程规划请求
+- 提交来源：应用记录的表单提交（secrets.toml 中配置 TRAFFIC_LOG，见 traffic_log.py），
+  或按常见分布合成（地点以韶关及下辖区县为主，夹杂拼音、错字和无法识别的输入；天数和主题按表单默认值偏斜）
+- 回放：泊松到达，按 --rates 逐级加压（开环：请求不因服务变慢而推迟发出，延迟包含排队时间），
+  --concurrency 个线程同时执行规划（与 Streamlit 每个会话一个脚本线程相同）；
+  使用记录文件时也可以用 --speed 按原始时间间隔加速回放
+- 每次提交执行与"一键生成攻略"相同的代码：地点表（按数据版本挂载）后调用 planning.plan_trip
+  （离线地点解析 → 高德天气（经配额管理器）→ 历史同期气候补齐 → 生成备选行程 → 保存永久链接）；
+  可选的大模型润色步骤见 --llm-latency
+- 高德和大模型接口在独立进程中本地模拟（scripts/fake_amap_server.py 和 OpenAI 兼容的模拟接口），延迟可配置
+- 报告：吞吐量、延迟分位数、各步骤平均耗时、天气失败率、高德服务端拒绝数、永久链接命中率，
+  以及 p99 满足延迟目标、没有失败且天气失败率不超过 --max-weather-failure 的最高速率（饱和点）
+
+应用目前还没有调用大模型；--llm-latency 大于 0 时在规划后按提示词模板发起一次模拟调用，用于评估接入后的容量。
+
+用法：
+  python scripts/replay_traffic.py --rates 1 2 4 8 --duration 10 --concurrency 8 --amap-latency 0.05
+  python scripts/replay_traffic.py --log traffic_log.jsonl --speed 10
+  python scripts/replay_traffic.py --write-log synthetic.jsonl --count 500 --rates 2
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import fake_amap_server  # noqa: E402
+import planner  # noqa: E402
+import planning  # noqa: E402
+from amap_quota import QuotaManager  # noqa: E402
+from catalog import CatalogStore  # noqa: E402
+from climatology import load_climatology  # noqa: E402
+from location_resolver import load_resolver  # noqa: E402
+from permalink import PlanStore  # noqa: E402
+from shared_catalog import SharedCatalogHost, SharedCatalogStore, attach_reference  # noqa: E402
+from traffic_log import TrafficLog, read_submissions  # noqa: E402
+
+DATA_DIR = str(BASE_DIR / "processed_data")
+PLAN_ALTERNATIVES = 5  # 与 main.py 相同
+STAGES = ("地点表", "地点解析", "高德天气", "气候补齐", "规划", "大模型", "永久链接")
+
+# 合成提交的分布（权重）
+LOCATIONS = [
+    ("韶关", 50), ("韶关市", 6), ("shaoguan", 4), ("仁化", 6), ("丹霞山", 3), ("乳源", 4), ("南雄", 4),
+    ("乐昌", 3), ("始兴", 2), ("翁源", 2), ("新丰", 1), ("曲江", 2), ("浈江区", 1), ("武江区", 1),
+    ("韶官", 2), ("shoaguan", 1), ("广州", 3), ("深圳", 2), ("长沙", 1), ("xyz", 1),
+]
+TRAVEL_DAYS = [(1, 8), (2, 22), (3, 38), (4, 14), (5, 10), (6, 4), (7, 4)]
+THEMES = [("历史人文", 40), ("自然风光", 25), ("美食探索", 15), ("文化体验", 12), ("家庭亲子", 8)]
+
+
+# ---------------------- 模拟后端（独立进程） ----------------------
+
+def make_llm_handler(latency, counter):
+    class FakeLlmHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if latency:
+                time.sleep(latency)
+            with counter["lock"]:
+                counter["total"] += 1
+            prompt = body.get("messages", [{}])[-1].get("content", "")
+            self._send({
+                "id": "chatcmpl-replay",
+                "object": "chat.completion",
+                "model": body.get("model", "deepseek-chat"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "行程已润色。"}}],
+                "usage": {"prompt_tokens": len(prompt), "completion_tokens": 6, "total_tokens": len(prompt) + 6},
+            })
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send({"total": counter["total"]})
+            else:
+                self.send_error(404)
+
+        def _send(self, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeLlmHandler
+
+
+def run_backends(keys, amap_qps, amap_latency, llm_latency, ready):
+    """在独立进程中运行模拟的高德和大模型接口（不与被测规划代码争用同一个解释器）"""
+    amap, _ = fake_amap_server.start_server(keys, amap_qps, 10 ** 9, amap_latency, port=0)
+    llm = ThreadingHTTPServer(("127.0.0.1", 0), make_llm_handler(llm_latency, {"lock": threading.Lock(), "total": 0}))
+    threading.Thread(target=llm.serve_forever, daemon=True).start()
+    ready.put((amap.server_address[1], llm.server_address[1]))
+    while True:
+        time.sleep(3600)
+
+
+# ---------------------- 提交来源 ----------------------
+
+def synthesize(count, seed):
+    """按常见分布合成表单提交"""
+    rng = random.Random(seed)
+
+    def pick(choices):
+        values, weights = zip(*choices)
+        return rng.choices(values, weights=weights)[0]
+
+    return [
+        {"ts": 0.0, "location": pick(LOCATIONS), "travel_days": pick(TRAVEL_DAYS), "travel_theme": pick(THEMES)}
+        for _ in range(count)
+    ]
+
+
+def poisson_schedule(rate, duration, rng):
+    """泊松到达的发出时刻（相对开始时间，秒）"""
+    times, t = [], rng.expovariate(rate)
+    while t < duration:
+        times.append(t)
+        t += rng.expovariate(rate)
+    return times
+
+
+def recorded_schedule(submissions, speed):
+    """按记录的时间间隔加速回放的发出时刻"""
+    start = submissions[0]["ts"]
+    return [(item["ts"] - start) / speed for item in submissions]
+
+
+# ---------------------- 规划路径 ----------------------
+
+class PlanningPath:
+    """与 main.py 中"一键生成攻略"相同的处理步骤（不经过 Streamlit 页面）"""
+
+    def __init__(self, amap_url, llm_url, keys, qps, store_path):
+        self.catalog = None
+        try:
+            host = SharedCatalogHost()
+            self.resolver, self.climatology = attach_reference(host)
+            self.catalog = SharedCatalogStore(
+                host, DATA_DIR, lambda snapshot: planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture)
+            )
+            if self.catalog.current() is None:
+                self.catalog = None
+        except OSError:
+            self.resolver, self.climatology = load_resolver(), load_climatology()
+        # 与 main.get_catalog_store 相同：共享镜像不可用时在进程内加载，由后台线程监视数据文件
+        if self.catalog is None:
+            self.catalog = CatalogStore(DATA_DIR)
+            self.catalog.reload()
+        self.catalog.start_watcher()
+        self._poi_index = {}
+        self.manager = QuotaManager(keys, qps=qps, base_url=amap_url)
+        self.llm_url = llm_url
+        self.store = PlanStore(store_path)
+        with open(BASE_DIR / "prompt_template.txt", encoding="utf-8") as f:
+            self.prompt_template = f.read()
+        self.weather_requests = 0
+        self.weather_failures = 0
+        self._lock = threading.Lock()
+
+    def load_pois(self):
+        """与 main.load_data 相同：取当前版本的地点表，进程内加载时每个版本构建一次（最多保留两个版本）"""
+        snapshot = self.catalog.current()
+        if isinstance(self.catalog, SharedCatalogStore):
+            return snapshot.pois
+        with self._lock:
+            pois = self._poi_index.get(snapshot.signature)
+            if pois is None:
+                pois = planner.build_pois(snapshot.attractions, snapshot.foods, snapshot.culture)
+                # 只保留上一个版本和当前版本
+                self._poi_index = {**dict(list(self._poi_index.items())[-1:]), snapshot.signature: pois}
+        return pois
+
+    def polish(self, itinerary, weather_data):
+        """模拟的大模型润色调用（OpenAI 兼容接口）"""
+        names = [name for day in itinerary["days"] for name in day["depends_on"]["pois"]]
+        prompt = self.prompt_template.format(
+            days=len(itinerary["days"]), budget=1000, interest=itinerary["theme"],
+            attractions="、".join(names[0::3]), food="、".join(names[1::3]), culture="、".join(names[2::3]),
+            special_needs="无", weather_advice="；".join(day["weather"] for day in itinerary["days"]),
+        )
+        response = requests.post(f"{self.llm_url}/v1/chat/completions", json={
+            "model": "deepseek-chat", "messages": [{"role": "user", "content": prompt}]
+        }, timeout=60)
+        return response.json()["choices"][0]["message"]["content"]
+
+    def run(self, submission):
+        """处理一次提交，返回各步骤耗时（秒）"""
+        start = time.perf_counter()
+        pois = self.load_pois()
+        timings = {"地点表": time.perf_counter() - start}
+
+        result = planning.plan_trip(
+            submission["location"], submission["travel_days"], submission["travel_theme"], pois,
+            self.resolver, self.climatology, self.manager, store=self.store, k=PLAN_ALTERNATIVES
+        )
+        timings.update(result.timings)
+        if result.resolved is not None:
+            with self._lock:
+                self.weather_requests += 1
+                self.weather_failures += result.weather.get("status") != "success"
+        if result.store_error:
+            raise RuntimeError(f"行程存储错误: {result.store_error}")
+
+        # 无法识别的地点在应用中直接被拒绝，不生成行程，也没有润色调用
+        if self.llm_url and result.alternatives:
+            start = time.perf_counter()
+            self.polish(result.alternatives[0], result.weather_data)
+            timings["大模型"] = time.perf_counter() - start
+        return timings
+
+
+# ---------------------- 回放与统计 ----------------------
+
+def amap_stats(amap_url):
+    """模拟高德接口累计的 (收到的请求数, 计入日用量的请求数)"""
+    stats = requests.get(f"{amap_url}/stats", timeout=5).json()
+    return sum(stats["total"].values()), sum(stats["daily_used"].values())
+
+
+def percentile(values, p):
+    """最近秩法分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def replay(path, submissions, offsets, concurrency, drain_timeout):
+    """按发出时刻回放，返回 (每次提交的延迟列表, 各步骤耗时汇总, 错误数, 未完成数, 耗时)"""
+    pending = queue.Queue()
+    latencies, stage_totals, errors = [], defaultdict(float), []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            arrival, submission = item
+            if stop.is_set():
+                continue
+            try:
+                timings = path.run(submission)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            finished = time.perf_counter()
+            with lock:
+                latencies.append(finished - arrival)
+                for stage, seconds in timings.items():
+                    stage_totals[stage] += seconds
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for offset, submission in zip(offsets, submissions):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((start + offset, submission))
+
+    # 发完后等待积压处理完，超过 drain_timeout 仍未处理的记为未完成
+    deadline = time.perf_counter() + drain_timeout
+    while time.perf_counter() < deadline:
+        with lock:
+            done = len(latencies) + len(errors)
+        if done >= len(offsets):
+            break
+        time.sleep(0.01)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    with lock:
+        unfinished = len(offsets) - len(latencies) - len(errors)
+        return list(latencies), dict(stage_totals), list(errors), unfinished, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", help="回放应用记录的提交（traffic_log.jsonl），不指定时按分布合成")
+    parser.add_argument("--speed", type=float, help="与 --log 一起使用：按记录的时间间隔加速回放的倍数")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1, 2, 4, 8, 16], help="逐级加压的到达速率（次/秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="每级持续时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时执行规划的线程数")
+    parser.add_argument("--amap-latency", type=float, default=0.05, help="模拟高德接口延迟（秒）")
+    parser.add_argument("--amap-keys", type=int, default=1, help="模拟的高德密钥数")
+    parser.add_argument("--amap-qps", type=int, default=3, help="每个密钥的 QPS 限制")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="模拟大模型接口延迟（秒），0 表示不调用")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p99 延迟目标（毫秒），用于判断饱和点")
+    parser.add_argument("--max-weather-failure", type=float, default=0.01,
+                        help="天气请求失败率上限，超过时该级不计入饱和点（行程已退化为历史同期气候）")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--write-log", help="把合成的提交写入记录文件（格式与应用记录相同）后退出")
+    parser.add_argument("--count", type=int, default=500, help="与 --write-log 一起使用：合成的提交数")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.write_log:
+        log = TrafficLog(args.write_log)
+        ts = time.time()
+        for item in synthesize(args.count, args.seed):
+            ts += rng.expovariate(args.rates[0])
+            log.record(item["location"], item["travel_days"], item["travel_theme"], ts=ts)
+        print(f"✅ 已写入 {args.count} 条合成提交（平均 {args.rates[0]:g} 次/秒）: {args.write_log}")
+        return
+
+    recorded = read_submissions(args.log) if args.log else None
+    if args.log and not recorded:
+        sys.exit(f"记录文件中没有可用的提交: {args.log}")
+
+    keys = [f"{i:032x}" for i in range(1, args.amap_keys + 1)]
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    backends = context.Process(target=run_backends, daemon=True,
+                               args=(keys, args.amap_qps, args.amap_latency, args.llm_latency, ready))
+    backends.start()
+    amap_port, llm_port = ready.get(timeout=30)
+    amap_url = f"http://127.0.0.1:{amap_port}"
+
+    work_dir = tempfile.mkdtemp(prefix="replay-")
+    try:
+        path = PlanningPath(amap_url, f"http://127.0.0.1:{llm_port}" if args.llm_latency > 0 else None,
+                            keys, args.amap_qps, os.path.join(work_dir, "plan_store.sqlite3"))
+        # 预热：加载地点表、构建索引（与应用启动时的预热相同，不计入结果）
+        path.run({"location": "韶关", "travel_days": 3, "travel_theme": "历史人文"})
+        time.sleep(1.0)  # 让模拟高德接口的限流窗口清空
+
+        if recorded and args.speed:
+            steps = [(f"×{args.speed:g}", recorded, recorded_schedule(recorded, args.speed))]
+        else:
+            pool = recorded or synthesize(max(1, int(max(args.rates) * args.duration * 2)), args.seed)
+            steps = []
+            for rate in args.rates:
+                offsets = poisson_schedule(rate, args.duration, rng)
+                submissions = [pool[i % len(pool)] for i in range(len(offsets))]
+                steps.append((f"{rate:g}", submissions, offsets))
+
+        print("=" * 100)
+        source = f"记录文件 {args.log}（{len(recorded)} 条）" if recorded else f"按分布合成（种子 {args.seed}）"
+        llm = f"{args.llm_latency * 1e3:.0f}ms" if args.llm_latency > 0 else "不调用"
+        print(f"提交来源: {source}；并发线程: {args.concurrency}；"
+              f"高德: {args.amap_keys} 个密钥 × {args.amap_qps} QPS，延迟 {args.amap_latency * 1e3:.0f}ms；大模型: {llm}")
+        print("延迟单位为毫秒，从计划到达时刻算起（含排队）")
+        print(f"{'到达/s':>8}{'提交':>6}{'完成/s':>8}{'p50':>8}{'p90':>8}{'p99':>8}{'最大':>8}"
+              f"{'失败':>6}{'未完成':>6}{'天气失败':>8}{'高德拒绝':>8}{'链接命中':>8}")
+
+        results, stage_summary = [], []
+        for label, submissions, offsets in steps:
+            path.weather_requests = path.weather_failures = 0
+            before_amap = amap_stats(amap_url)
+            before_plans = path.store.stats()["plans"]
+            latencies, stage_totals, errors, unfinished, elapsed = replay(
+                path, submissions, offsets, args.concurrency, drain_timeout=max(args.duration, 5.0)
+            )
+            completed = len(latencies)
+            # 服务端拒绝 = 发到模拟高德的请求中未计入日用量的部分（超出 QPS 或配额）
+            amap = amap_stats(amap_url)
+            amap_rejected = (amap[0] - before_amap[0]) - (amap[1] - before_amap[1])
+            # 永久链接命中：相同行程已在存储中，不新增记录
+            new_plans = path.store.stats()["plans"] - before_plans
+            link_hit = 1 - new_plans / completed if completed else float("nan")
+            weather_fail = path.weather_failures / path.weather_requests if path.weather_requests else 0.0
+            throughput = completed / elapsed if elapsed else 0.0
+            ms = [latency * 1e3 for latency in latencies]
+            p99 = percentile(ms, 99)
+            print(f"{label:>8}{len(offsets):>6}{throughput:>8.1f}{percentile(ms, 50):>8.0f}{percentile(ms, 90):>8.0f}"
+                  f"{p99:>8.0f}{max(ms, default=float('nan')):>8.0f}{len(errors):>6}{unfinished:>6}"
+                  f"{weather_fail:>8.0%}{amap_rejected:>8}{link_hit:>8.0%}")
+            results.append((label, p99, len(errors) + unfinished, weather_fail))
+            stage_summary.append((label, {stage: stage_totals.get(stage, 0.0) / max(completed, 1) for stage in STAGES}))
+            if errors:
+                print(f"         首个错误: {errors[0]}")
+
+        print("-" * 100)
+        print("各步骤平均耗时（毫秒/次）: " + "  ".join(STAGES))
+        for label, stages in stage_summary:
+            print(f"{label:>8}  " + "  ".join(f"{stages[stage] * 1e3:>{len(stage) * 2}.1f}" for stage in STAGES))
+
+        # 饱和点：p99 在目标内、没有失败且天气失败率不超过上限的最高一级
+        # （开环回放下处理跟不上时排队延迟会迅速超过目标；高德配额不足时天气请求先失败）
+        healthy = [
+            label for label, p99, failed, weather_fail in results
+            if p99 <= args.slo_ms and not failed and weather_fail <= args.max_weather_failure
+        ]
+        print("-" * 100)
+        if len(results) > 1:
+            if len(healthy) == len(results):
+                print(f"饱和点: 高于 {results[-1][0]} 次/秒（各级均满足 p99 ≤ {args.slo_ms:.0f}ms 且天气失败率 ≤ "
+                      f"{args.max_weather_failure:.0%}），可继续提高 --rates")
+            elif healthy:
+                print(f"饱和点: 约 {healthy[-1]} 次/秒（更高速率下 p99 超过 {args.slo_ms:.0f}ms、出现失败"
+                      f"或天气失败率超过 {args.max_weather_failure:.0%}）")
+            else:
+                print(f"饱和点: 低于 {results[0][0]} 次/秒（最低一级已不满足 p99 ≤ {args.slo_ms:.0f}ms、"
+                      f"无失败且天气失败率 ≤ {args.max_weather_failure:.0%}）")
+        worst_weather = max((result[3] for result in results), default=0.0)
+        if worst_weather > 0:
+            print(f"提示: 天气请求失败率最高 {worst_weather:.0%}（行程改用历史同期气候），"
+                  f"高德密钥总配额为 {args.amap_keys * args.amap_qps} 次/秒")
+        print("=" * 100)
+    finally:
+        backends.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+多进程共享的只读数据镜像
+- 同一主机上的多个 worker 进程共用一份数据：地点表、地点解析索引、气候表以对齐的 numpy 数组
+  和字符串堆的形式写入 /dev/shm 下的镜像文件，每个版本只发布一次
+- 数据目录的每个版本只由发布镜像的进程读取 CSV、创建 DataFrame，镜像中保存规划用地点表和
+  各表记录数，其余进程不再各自加载数据目录
+- worker 以只读 mmap 方式挂载，数组直接指向共享页面，不复制
+- 引用计数：进程内按镜像计数；进程间以镜像文件上的共享锁（flock LOCK_SH）作为租约，
+  映射存在期间租约一直有效，进程退出或崩溃时由内核释放
+- 数据目录换版本后，旧版本镜像在所有进程都释放后才会被删除（能拿到排他锁即说明已无读者）
+- 镜像名包含布局版本：写入的数组有变化时修改 CATALOG_LAYOUT / REFERENCE_LAYOUT，
+  /dev/shm 中旧程序发布的镜像不会被新程序复用；万一缺少数组（KeyError）则丢弃后重新发布
+- SharedCatalogStore 在后台线程中发布 / 挂载新版本并原子替换，请求路径上不读取 CSV、不等待发布
+"""
+
+import fcntl
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import weakref
+from collections.abc import Sequence
+
+import numpy as np
+
+from catalog import DATA_FILES, CatalogStore, build_snapshot, file_signature
+from climatology import CLIMATE_PATH, Climatology, load_climatology
+from location_resolver import ADCODE_PATH, LocationResolver, load_resolver
+
+IMAGE_DIR = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "shaoguan-travel")
+
+MAGIC = b"SGIMG001"
+# 镜像布局版本（add_pois、SharedCatalogVersion、LocationResolver / Climatology.add_to_image 写入的内容变化时加一）
+CATALOG_LAYOUT = 2
+REFERENCE_LAYOUT = 1
+HEADER = struct.Struct("<8sQ")  # 魔数、清单长度
+ALIGNMENT = 64
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def image_key(prefix, signature, layout):
+    """由布局版本和数据签名生成镜像名（同一份数据、同一布局在所有进程中得到相同的名字）"""
+    return f"{prefix}-{hashlib.sha1(repr((layout, signature)).encode('utf-8')).hexdigest()[:16]}"
+
+
+def path_signature(*paths):
+    """源文件的 (文件名, 修改时间, 大小) 签名"""
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class ImageWriter:
+    """收集数组和字符串列，写出镜像文件"""
+
+    def __init__(self):
+        self._arrays = {}
+
+    def add_array(self, name, array):
+        self._arrays[name] = np.ascontiguousarray(array)
+
+    def add_strings(self, name, strings):
+        """字符串列：偏移数组 + UTF-8 字节堆"""
+        encoded = [str(s).encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        self.add_array(f"{name}.offsets", offsets)
+        self.add_array(f"{name}.data", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def write(self, directory):
+        """写入目录下的临时文件并返回路径（由调用方原子重命名）"""
+        manifest, position = {}, 0
+        for name, array in self._arrays.items():
+            manifest[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+            position = _align(position + array.nbytes)
+        manifest_bytes = json.dumps(manifest).encode("utf-8")
+        data_start = _align(HEADER.size + len(manifest_bytes))
+
+        fd, path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".img")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, len(manifest_bytes)))
+                f.write(manifest_bytes)
+                for name, array in self._arrays.items():
+                    f.seek(data_start + manifest[name]["offset"])
+                    f.write(array.tobytes())
+                f.truncate(data_start + position)
+            os.chmod(path, 0o644)  # 同一主机上以其他用户运行的 worker 也能挂载
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path
+
+
+class StringColumn(Sequence):
+    """镜像中的字符串列，按下标解码（通过 memoryview 读取，不复制）"""
+
+    def __init__(self, offsets, data):
+        self._offsets = memoryview(offsets)
+        self._data = memoryview(data)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self._offsets) - 1:
+            raise IndexError(index)
+        return str(self._data[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+
+class CatalogImage:
+    """只读挂载的镜像文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            # 租约：映射复制了文件描述符，映射存在期间共享锁一直有效
+            fcntl.flock(self._file, fcntl.LOCK_SH)
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, length = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"不是数据镜像文件: {path}")
+            self._manifest = json.loads(self._map[HEADER.size:HEADER.size + length].decode("utf-8"))
+            self._data_start = _align(HEADER.size + length)
+            self.size = len(self._map)
+            self.inode = os.fstat(self._file.fileno()).st_ino
+        except BaseException:
+            self._file.close()
+            raise
+
+    @property
+    def unlinked(self):
+        """镜像文件是否已被回收（挂载后发现已删除时需要重新发布）"""
+        return os.fstat(self._file.fileno()).st_nlink == 0
+
+    def array(self, name):
+        """数组视图（只读，直接指向共享页面）"""
+        spec = self._manifest[name]
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        array = np.frombuffer(self._map, dtype=np.dtype(spec["dtype"]), count=count,
+                              offset=self._data_start + spec["offset"])
+        return array.reshape(spec["shape"])
+
+    def strings(self, name):
+        return StringColumn(self.array(f"{name}.offsets"), self.array(f"{name}.data"))
+
+    def __contains__(self, name):
+        return name in self._manifest or f"{name}.offsets" in self._manifest
+
+    def release(self):
+        """关闭文件；已取出的数组视图仍然有效，最后一个视图释放后解除映射并释放租约"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._map = None
+
+
+class SharedCatalogHost:
+    """本机镜像目录：发布、挂载、引用计数和回收"""
+
+    def __init__(self, directory=IMAGE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._attached = {}  # 镜像名 → [CatalogImage, 进程内引用数]
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.img")
+
+    def acquire(self, key, build):
+        """挂载镜像（不存在时调用 build() 生成 ImageWriter 并发布），引用数加一"""
+        with self._lock:
+            entry = self._attached.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+            image = self._open_existing(key) or self._publish(key, build)
+            self._attached[key] = [image, 1]
+            return image
+
+    def release(self, key):
+        """引用数减一，归零时释放本进程的租约"""
+        with self._lock:
+            entry = self._attached.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._attached[key]
+                entry[0].release()
+
+    def load(self, key, build, factory):
+        """挂载镜像并返回 factory(image)；镜像缺少所需数组（旧程序发布的同名镜像）时丢弃并重新发布"""
+        image = self.acquire(key, build)
+        try:
+            return factory(image)
+        except KeyError:
+            self._discard(key, image)
+            return factory(self.acquire(key, build))
+
+    def attach(self, key, build, factory):
+        """挂载镜像并用 factory(image) 包装，引用与返回对象的生命周期绑定：对象被回收时自动释放"""
+        owner = self.load(key, build, factory)
+        weakref.finalize(owner, self.release, key)
+        return owner
+
+    def _discard(self, key, image):
+        """放弃本进程对镜像的全部引用，并删除仍是该文件的镜像名（已映射的进程不受影响）"""
+        with self._lock:
+            entry = self._attached.get(key)
+            if entry is not None and entry[0] is image:
+                del self._attached[key]
+        with open(os.path.join(self.directory, ".publish.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.stat(self.path_for(key)).st_ino == image.inode:
+                    os.unlink(self.path_for(key))
+            except FileNotFoundError:
+                pass
+        image.release()
+
+    def _open_existing(self, key):
+        try:
+            image = CatalogImage(self.path_for(key))
+        except FileNotFoundError:
+            return None
+        if image.unlinked:
+            image.release()
+            return None
+        return image
+
+    def _publish(self, key, build):
+        """同一时刻只有一个进程生成镜像，其余进程等待后直接挂载"""
+        with open(os.path.join(self.directory, ".publish.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            image = self._open_existing(key)
+            if image is not None:
+                return image
+            tmp_path = build().write(self.directory)
+            # 先取得租约再改名，避免刚发布就被其他进程回收
+            image = CatalogImage(tmp_path)
+            os.replace(tmp_path, self.path_for(key))
+            image.path = self.path_for(key)
+            return image
+
+    def collect(self, prefix, keep=()):
+        """删除 prefix 开头、不在 keep 中且已没有任何进程持有的镜像，返回删除的镜像名"""
+        removed = []
+        with self._lock:
+            attached = set(self._attached)
+        for path in glob.glob(os.path.join(self.directory, f"{prefix}-*.img")):
+            key = os.path.basename(path)[:-len(".img")]
+            if key in keep or key in attached:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.unlink(path)
+                    removed.append(key)
+            except (BlockingIOError, FileNotFoundError):
+                continue
+        return removed
+
+    def status(self):
+        with self._lock:
+            return {
+                key: {"refs": refs, "bytes": image.size}
+                for key, (image, refs) in self._attached.items()
+            }
+
+
+# ---------------------- 数据目录：规划用地点表和记录数 ----------------------
+
+POI_KINDS = ("attraction", "food", "culture")
+
+
+def add_pois(writer, pois):
+    """把 planner.build_pois 的结果写入镜像"""
+    for field in ("id", "name", "tag", "note"):
+        writer.add_strings(f"pois.{field}", [poi[field] for poi in pois])
+    writer.add_array("pois.kind", np.array([POI_KINDS.index(poi["kind"]) for poi in pois], dtype=np.uint8))
+    writer.add_array("pois.quality", np.array([poi["quality"] for poi in pois], dtype=np.float64))
+    writer.add_array("pois.closed", np.array(
+        [sum(1 << day for day in poi["closed"]) for poi in pois], dtype=np.uint8
+    ))
+
+
+class SharedPois(Sequence):
+    """镜像中的地点表，按下标还原为与 planner.build_pois 相同的字典"""
+
+    def __init__(self, image):
+        self._id = image.strings("pois.id")
+        self._name = image.strings("pois.name")
+        self._tag = image.strings("pois.tag")
+        self._note = image.strings("pois.note")
+        self._kind = memoryview(image.array("pois.kind"))
+        self._quality = memoryview(image.array("pois.quality"))
+        self._closed = memoryview(image.array("pois.closed"))
+
+    def __len__(self):
+        return len(self._kind)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        closed = self._closed[index]
+        return {
+            "id": self._id[index],
+            "name": self._name[index],
+            "kind": POI_KINDS[self._kind[index]],
+            "tag": self._tag[index],
+            "quality": self._quality[index],
+            "closed": frozenset(day for day in range(7) if closed >> day & 1),
+            "note": self._note[index],
+        }
+
+
+class SharedCatalogVersion:
+    """镜像中的某一数据版本：地点表、各表记录数、文件签名、加载时间和缺失文件等错误"""
+
+    def __init__(self, image):
+        self.version = os.path.basename(image.path)[:-len(".img")]
+        self.pois = SharedPois(image)
+        self.counts = dict(zip(DATA_FILES, image.array("catalog.counts").tolist()))
+        meta = json.loads(image.strings("catalog.meta")[0])
+        self.signature = tuple(tuple(item) for item in meta["signature"])
+        self.loaded_at = meta["loaded_at"]
+        self.errors = meta["errors"]
+
+
+def attach_catalog(host, data_dir, signature, build_pois, allow_errors=True):
+    """挂载指定数据版本的镜像；镜像不存在时由本进程读取 CSV，用 build_pois(snapshot) 生成地点表并发布
+
+    读取期间文件被改写（签名不一致）、或 allow_errors 为 False 时有文件缺失，抛出 ValueError，不发布该版本。
+    返回的对象被回收时释放引用；同时回收其他进程都已不再使用的旧版本镜像。
+    """
+    key = image_key("catalog", signature, CATALOG_LAYOUT)
+
+    def build():
+        snapshot = build_snapshot(data_dir, 0)
+        if snapshot.signature != signature:
+            raise ValueError("数据文件在加载期间发生变化，稍后重试")
+        if snapshot.errors and not allow_errors:
+            raise ValueError("；".join(snapshot.errors.values()))
+        writer = ImageWriter()
+        add_pois(writer, build_pois(snapshot))
+        writer.add_array("catalog.counts", np.array(
+            [len(getattr(snapshot, name)) for name in DATA_FILES], dtype=np.int64
+        ))
+        writer.add_strings("catalog.meta", [json.dumps(
+            {"signature": signature, "loaded_at": snapshot.loaded_at, "errors": snapshot.errors}, ensure_ascii=False
+        )])
+        return writer
+
+    catalog = host.attach(key, build, SharedCatalogVersion)
+    host.collect("catalog", keep=(key,))
+    return catalog
+
+
+class SharedCatalogStore(CatalogStore):
+    """与 CatalogStore 相同的用法，但当前版本是共享镜像（SharedCatalogVersion）而不是进程内快照
+
+    后台监视线程发现文件签名变化后挂载新版本（本主机还没有时由本进程读取 CSV 并发布），再原子替换；
+    请求只读取当前版本的引用，发布期间继续使用上一个已发布的版本，不在请求路径上等待。
+    """
+
+    def __init__(self, host, data_dir, build_pois, poll_interval=2.0):
+        super().__init__(data_dir, poll_interval)
+        self.host = host
+        self.build_pois = build_pois
+
+    def current(self):
+        """获取当前版本；首次加载失败时返回 None（调用方退回进程内加载）"""
+        catalog = self._snapshot
+        if catalog is None:
+            self.reload()
+            catalog = self._snapshot
+        return catalog
+
+    def reload(self, force=False):
+        """挂载当前文件对应的版本并替换；已有版本时，文件缺失或读取期间被改写都保留旧版本"""
+        if not self._reload_lock.acquire(blocking=self._snapshot is None):
+            return False
+        try:
+            if not force and not self.is_stale():
+                return False
+
+            previous = self._snapshot
+            catalog = attach_catalog(self.host, self.data_dir, file_signature(self.data_dir), self.build_pois,
+                                     allow_errors=previous is None)
+            # 其他进程首次启动时可能已发布了缺文件的版本，不换入
+            if catalog.errors and previous is not None:
+                self.last_error = "；".join(catalog.errors.values())
+                return False
+
+            self._snapshot = catalog  # 原子替换，进行中的请求继续使用旧版本
+            self.last_error = ""
+            # 本进程不再持有旧版本时即可回收（仍在使用它的请求和其他进程持有租约，不会被删除）
+            del previous
+            self.host.collect("catalog", keep=(catalog.version,))
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+        finally:
+            self._reload_lock.release()
+
+
+# ---------------------- 地点解析索引和气候表 ----------------------
+
+def attach_reference(host):
+    """挂载行政区划索引和气候表的镜像，返回 (LocationResolver, Climatology)"""
+    key = image_key("reference", path_signature(ADCODE_PATH, CLIMATE_PATH), REFERENCE_LAYOUT)
+
+    def build():
+        writer = ImageWriter()
+        load_resolver().add_to_image(writer)
+        load_climatology().add_to_image(writer)
+        return writer
+
+    reference = host.load(key, build, lambda image: (LocationResolver.from_image(image), Climatology.from_image(image)))
+    host.collect("reference", keep=(key,))
+    return reference
@@ -0,0 +1,184 @@
+"""
+高德配额管理器测试：对本地模拟高德服务（scripts/fake_amap_server.py）发起真实 HTTP 请求
+"""
+
+import socket
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "scripts"))
+
+import fake_amap_server  # noqa: E402
+from amap_quota import QuotaManager  # noqa: E402
+
+KEY_A = "a" * 32
+KEY_B = "b" * 32
+WEATHER = "/v3/weather/weatherInfo"
+PARAMS = {"city": "440200", "extensions": "all", "output": "JSON"}
+
+
+@pytest.fixture
+def fake_amap():
+    servers = []
+
+    def start(keys, qps=3, daily_limit=5000):
+        server, state = fake_amap_server.start_server(keys, qps, daily_limit, port=0)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def rejected(state, key):
+    """服务端拒绝（未计入日用量）的请求数"""
+    return state.total[key] - state.daily_used[key]
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_rotates_keys(fake_amap):
+    url, state = fake_amap([KEY_A, KEY_B], qps=1)
+    manager = QuotaManager([KEY_A, KEY_B], qps=1, base_url=url)
+
+    for _ in range(2):
+        assert manager.request(WEATHER, PARAMS, max_wait=0)["status"] == "1"
+
+    assert state.daily_used[KEY_A] == 1
+    assert state.daily_used[KEY_B] == 1
+
+
+def test_never_exceeds_server_qps(fake_amap):
+    url, state = fake_amap([KEY_A, KEY_B], qps=2)
+    manager = QuotaManager([KEY_A, KEY_B], qps=2, base_url=url)
+
+    for _ in range(12):
+        assert manager.request(WEATHER, PARAMS, max_wait=2.0)["status"] == "1"
+
+    assert rejected(state, KEY_A) == 0
+    assert rejected(state, KEY_B) == 0
+
+
+def test_qps_rejection_does_not_use_up_attempts(fake_amap):
+    # 服务端比本地配置更严格：10004 后停用一个窗口再重试同一个密钥，而不是直接失败
+    url, state = fake_amap([KEY_A], qps=1)
+    manager = QuotaManager([KEY_A], qps=5, base_url=url)
+
+    assert manager.request(WEATHER, PARAMS, max_wait=0)["status"] == "1"
+    assert manager.request(WEATHER, PARAMS, max_wait=2.0)["status"] == "1"
+    assert rejected(state, KEY_A) == 1
+    assert manager.status()[0]["state"] == "closed"
+
+
+def test_daily_limit_trips_breaker(fake_amap):
+    url, state = fake_amap([KEY_A], daily_limit=1)
+    manager = QuotaManager([KEY_A], base_url=url)
+
+    assert manager.request(WEATHER, PARAMS)["status"] == "1"
+    assert manager.request(WEATHER, PARAMS)["info"] == "DAILY_QUERY_OVER_LIMIT"
+    status = manager.status()[0]
+    assert status["state"] == "open"
+    assert status["daily_remaining"] == 0
+
+    # 配额耗尽后立即失败，不再访问服务端
+    start = time.monotonic()
+    assert manager.request(WEATHER, PARAMS)["status"] == "0"
+    assert time.monotonic() - start < 0.1
+    assert state.total[KEY_A] == 2
+
+
+def test_invalid_key_falls_through(fake_amap):
+    url, state = fake_amap([KEY_B])
+    manager = QuotaManager([KEY_A, KEY_B], base_url=url)
+
+    for _ in range(3):
+        assert manager.request(WEATHER, PARAMS)["status"] == "1"
+
+    assert state.total[KEY_A] == 1
+    assert manager.status()[0]["state"] == "open"
+    assert manager.status()[1]["state"] == "closed"
+
+
+def test_half_open_recovery(fake_amap):
+    url, _ = fake_amap([KEY_A])
+    manager = QuotaManager([KEY_A], failure_threshold=1, cooldown=0.2,
+                           base_url=f"http://127.0.0.1:{unused_port()}")
+
+    assert manager.request(WEATHER, PARAMS, timeout=1)["status"] == "0"
+    assert manager.status()[0]["state"] == "open"
+
+    # 冷却期间立即失败；冷却结束后放行一次试探，成功则恢复
+    manager.base_url = url
+    start = time.monotonic()
+    assert manager.request(WEATHER, PARAMS)["status"] == "0"
+    assert time.monotonic() - start < 0.1
+    time.sleep(0.25)
+    assert manager.request(WEATHER, PARAMS)["status"] == "1"
+    assert manager.status()[0]["state"] == "closed"
+
+
+def test_probe_in_flight_fails_fast(fake_amap):
+    url, _ = fake_amap([KEY_A])
+    manager = QuotaManager([KEY_A], failure_threshold=1, cooldown=0.1, base_url=url)
+    manager.keys[0].breaker.trip()
+    time.sleep(0.15)
+
+    # 冷却结束后第一个请求取走试探名额，试探结束前其他请求不等待
+    probe = manager.acquire()
+    assert probe is not None and probe.breaker.state == "half_open"
+    start = time.monotonic()
+    assert manager.request(WEATHER, PARAMS, max_wait=1.0)["status"] == "0"
+    assert time.monotonic() - start < 0.1
+    manager.release(probe, "10000")
+
+
+def test_dead_backend_fails_fast():
+    manager = QuotaManager([KEY_A, KEY_B], failure_threshold=1, base_url=f"http://127.0.0.1:{unused_port()}")
+
+    manager.request(WEATHER, PARAMS, timeout=1)
+    start = time.monotonic()
+    assert manager.request(WEATHER, PARAMS, max_wait=1.0)["status"] == "0"
+    assert time.monotonic() - start < 0.1
+
+
+def test_host_ledger_shared_between_managers(fake_amap, tmp_path):
+    url, state = fake_amap([KEY_A], qps=2, daily_limit=5000)
+    ledger = tmp_path / "amap_quota.json"
+    workers = [QuotaManager([KEY_A], qps=2, daily_limit=3, base_url=url, ledger_path=str(ledger)) for _ in range(2)]
+
+    # 两个进程（管理器）合计每秒不超过 2 次
+    assert workers[0].request(WEATHER, PARAMS, max_wait=0)["status"] == "1"
+    assert workers[1].request(WEATHER, PARAMS, max_wait=0)["status"] == "1"
+    assert workers[0].acquire() is None
+    assert workers[1].acquire() is None
+
+    # 日配额同样合计
+    assert workers[0].request(WEATHER, PARAMS, max_wait=2.0)["status"] == "1"
+    assert workers[1].request(WEATHER, PARAMS, max_wait=2.0)["status"] == "0"
+    assert workers[1].status()[0]["daily_remaining"] == 0
+    assert state.daily_used[KEY_A] == 3
+    assert rejected(state, KEY_A) == 0
+
+
+def test_host_ledger_read_only_calls_do_not_write(fake_amap, tmp_path):
+    url, _ = fake_amap([KEY_A])
+    ledger = tmp_path / "amap_quota.json"
+    manager = QuotaManager([KEY_A], base_url=url, ledger_path=str(ledger))
+    assert manager.request(WEATHER, PARAMS)["status"] == "1"
+
+    before = ledger.stat().st_mtime_ns, ledger.read_text()
+    time.sleep(0.01)
+    manager.status()
+    manager.keys[0].limits.delay()
+    assert (ledger.stat().st_mtime_ns, ledger.read_text()) == before
@@ -0,0 +1,57 @@
+"""
+表单提交记录（容量规划用）
+- 在 secrets.toml 中设置 TRAFFIC_LOG = "traffic_log.jsonl" 后，每次点击"一键生成攻略"追加一行 JSON：
+  {"ts": 提交时间戳, "location": 地点, "travel_days": 天数, "travel_theme": 主题}
+- 只记录表单内容，不记录密钥、会话或客户端信息
+- scripts/replay_traffic.py 读取记录，按原始时间间隔或指定速率回放
+"""
+
+import json
+import os
+import threading
+import time
+
+FIELDS = ("location", "travel_days", "travel_theme")
+
+
+class TrafficLog:
+    """追加写入的提交记录（线程安全，进程内共享）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, location, travel_days, travel_theme, ts=None):
+        line = json.dumps({
+            "ts": round(time.time() if ts is None else ts, 3),
+            "location": location,
+            "travel_days": int(travel_days),
+            "travel_theme": travel_theme,
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def read_submissions(path):
+    """读取提交记录，跳过格式不正确的行，按时间排序"""
+    submissions = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+                submissions.append({
+                    "ts": float(item.get("ts", 0)),
+                    "location": str(item["location"]),
+                    "travel_days": int(item["travel_days"]),
+                    "travel_theme": str(item["travel_theme"]),
+                })
+            except (ValueError, KeyError, TypeError):
+                continue
+    submissions.sort(key=lambda item: item["ts"])
+    return submissions
+
+
+def resolve_path(path, base_dir):
+    """相对路径按应用目录解析"""
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)